@@ -1,24 +1,40 @@
+import logging
 import os
+import shlex
 
 import requests
-from flask import Flask, request, Response, abort
+from flask import Blueprint, Flask, request, Response, abort
 from pydantic import ValidationError
 
-from data import data_manager
-from data.user import User, Config
+from data import crypto, get_data_manager
+from data.user import INTERNAL_CONFIG_FIELDS, Config, PollState, User
 from notifications.interactions import (
     parse_args_from_callback_id,
     EVENT_CALLBACKS,
     get_event_payload,
 )
 from notifications.main_task import start_scheduler
+from notifications.metrics import CONTENT_TYPE, ERRORS, check_metrics_token, render
 
-app = Flask(__name__)
-start_scheduler(data_manager)
+logger = logging.getLogger(__name__)
+
+bp = Blueprint("gh", __name__)
+
+
+def create_app() -> Flask:
+    """Application factory, e.g. `gunicorn 'app:create_app()'`"""
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    return app
 
 
 def authenticate():
-    """Verify that the request is genuinely coming from Slack"""
+    """Verify that the request is genuinely coming from Slack (or, for metrics, the scraper)"""
+    if request.endpoint == "gh.metrics":
+        if not check_metrics_token(request.headers.get("Authorization")):
+            ERRORS.labels(stage="auth").inc()
+            abort(403)
+        return True
     if request.is_json:
         token = request.json.get("token")
     else:
@@ -28,17 +44,18 @@ def authenticate():
             token = payload.get("token")
     local = os.environ.get("VERIFICATION_TOKEN")
     if token != local:
-        print(token, local)
+        ERRORS.labels(stage="auth").inc()
+        logger.warning("Rejected request to %s with invalid token", request.path)
         abort(403)
     return True
 
 
-@app.before_request
+@bp.before_request
 def before_request():
     authenticate()
 
 
-@app.route("/gh/events", methods=["POST"])
+@bp.route("/gh/events", methods=["POST"])
 def slack_events():
     """Main events handler for events/messages from Slack"""
     payload = get_event_payload()
@@ -52,13 +69,13 @@ def slack_events():
     return Response(status=200)
 
 
-@app.route("/gh", methods=["GET"])
+@bp.route("/gh", methods=["GET"])
 def index():
     """Used just to test authentication"""
     return Response(status=204)
 
 
-@app.route("/gh/subscribe", methods=["POST"])
+@bp.route("/gh/subscribe", methods=["POST"])
 def subscribe():
     """Subscribe user to GitHub notifications"""
     user_id = request.values["user_id"]
@@ -74,22 +91,55 @@ def subscribe():
         # can't return a 401 here or Slack will think the request failed
         return Response("Invalid token", status=205)
     username = request.values["user_name"]
-    data_manager.subscribe_user(
-        User(user_id=user_id, username=username, token=gh_token)
-    )
+    data_manager = get_data_manager()
+    try:
+        user = data_manager.get(user_id)
+    except (ValidationError, crypto.DecryptionError) as e:
+        # unreadable, e.g. the token was encrypted with a key we no longer have:
+        # drop it so the user is subscribed afresh
+        logger.warning("Replacing unreadable data of user %s: %s", user_id, e)
+        data_manager.unsubscribe_user(user_id)
+        user = None
+    if user is not None:
+        # re-authenticating (e.g. after a revoked token): keep the user's config and
+        # history, and clear any backoff so polling resumes on the next cycle
+        user.token = gh_token
+        user.username = username
+        user.state = PollState()
+        data_manager.save(user)
+    else:
+        data_manager.subscribe_user(
+            User(user_id=user_id, username=username, token=gh_token)
+        )
     return Response(f"You are now subscribed to GitHub notifications.", 201)
 
 
-@app.route("/gh/config", methods=["POST"])
+@bp.route("/gh/config", methods=["POST"])
 def config():
     """Subscribe user to GitHub notifications"""
     user_id = request.values["user_id"]
+    data_manager = get_data_manager()
     try:
-        kv_pairs = request.values["text"].split(" ")
+        # quotes allow values with spaces, e.g. include_titles "breaking change"
+        kv_pairs = shlex.split(request.values["text"])
         tuple_list = [
             (kv_pairs[i], kv_pairs[i + 1]) for i in range(0, len(kv_pairs), 2)
         ]
-        config_update = dict(tuple_list)
+        config_update = {}
+        for key, value in tuple_list:
+            # a repeated key gives a list, e.g. several title patterns
+            if key in config_update:
+                previous = config_update[key]
+                if not isinstance(previous, list):
+                    previous = [previous]
+                value = previous + [value]
+            config_update[key] = value
+        if internal := sorted(config_update.keys() & INTERNAL_CONFIG_FIELDS):
+            return Response(
+                f"ERROR: {', '.join(internal)}: not a config option; "
+                "it's set by the notification buttons",
+                status=202,
+            )
         try:
             user = data_manager[user_id]
         except ValidationError:
@@ -97,6 +147,11 @@ def config():
                 "Corrupted user data, please unsubscribe and resubscribe.",
                 status=202,
             )
+        except crypto.DecryptionError:
+            return Response(
+                "Your stored GitHub token can't be read, please subscribe again.",
+                status=202,
+            )
         except KeyError:
             return Response(
                 "User is not subscribed. Please subscribe with GH notifications token.",
@@ -105,16 +160,24 @@ def config():
         existing_config = user.config.model_dump()
         existing_config.update(config_update)
         user.config = Config(**existing_config)
-        data_manager.save(user)
+        data_manager.save_config(user_id, user.config)
     except ValidationError as e:
         errors = e.errors()
         error_text = "ERROR: "
         for e in errors:
             if (msg := e["msg"]) == "Extra inputs are not permitted":
-                msg = "config option not recognised; hint:\n```/config frequency 15```"
+                msg = (
+                    "config option not recognised; options are: "
+                    + ", ".join(
+                        f
+                        for f in Config.model_fields
+                        if f not in INTERNAL_CONFIG_FIELDS
+                    )
+                    + "; hint:\n```/config frequency 15 reasons review_requested,mention```"
+                )
             error_text += f"{e['loc'][-1]}: {msg}\n"
         return Response(error_text, status=202)
-    except IndexError:
+    except (IndexError, ValueError):
         return Response(
             "ERROR: unable to parse space separated key/value pairs from message; hint:\n```/config frequency 15```",
             status=202,
@@ -122,13 +185,22 @@ def config():
     return Response(f"Config updated.", 200)
 
 
-@app.route("/gh/unsubscribe", methods=["POST"])
+@bp.route("/gh/metrics", methods=["GET"])
+def metrics():
+    """Prometheus metrics for this process"""
+    return Response(render(), status=200, content_type=CONTENT_TYPE)
+
+
+@bp.route("/gh/unsubscribe", methods=["POST"])
 def unsubscribe():
     """Unsubscribe user from GitHub notifications and delete all data"""
     user_id = request.values["user_id"]
-    data_manager.unsubscribe_user(user_id)
+    get_data_manager().unsubscribe_user(user_id)
     return Response(f"Unsubscribed", 200)
 
 
 if __name__ == "__main__":
-    app.run(port=7778, host="0.0.0.0", debug=True)
+    # Convenience for local development; in production run `python worker.py`
+    # alongside the web workers so the app can be scaled without duplicate polling.
+    start_scheduler(get_data_manager())
+    create_app().run(port=7778, host="0.0.0.0", debug=True)
@@ -0,0 +1,76 @@
+"""
+Micro-benchmark of Slack message rendering: `render_blocks` (precompiled
+templates) against `json.dumps(get_blocks(...))`, which is what the SDK did with
+the dict blocks before. The outputs are checked to be identical first.
+
+    python -m benchmarks.bench_blocks [--number 20000]
+"""
+
+import argparse
+import json
+import timeit
+from datetime import datetime
+
+from notifications.models import Comment, Notification
+from notifications.notify_slack import get_blocks, render_blocks
+
+
+def make_notification(comment_length: int | None) -> Notification:
+    comment = None
+    if comment_length is not None:
+        comment = Comment(
+            id=1,
+            body=('Looks good, one "nit" below — see `foo()`\n' * 200)[:comment_length],
+            author="octocat",
+            html_url="https://github.com/octocat/Hello-World/issues/123#issuecomment-1",
+        )
+    return Notification(
+        id=1,
+        slack_user_id="U0000001",
+        repo="octocat/Hello-World",
+        title="Add support for the <new> API",
+        reason="review_requested",
+        url="https://github.com/octocat/Hello-World/pull/123",
+        updated_at=datetime(2024, 1, 1),
+        thread_url="https://api.github.com/notifications/threads/1",
+        latest_comment=comment,
+    )
+
+
+CASES = {
+    "new, no comment": (make_notification(None), False),
+    "updated, short comment": (make_notification(200), True),
+    "updated, long comment": (make_notification(8000), True),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+    for name, (notification, updated) in CASES.items():
+        expected = json.dumps(get_blocks(notification, updated))
+        assert render_blocks(notification, updated) == expected, name
+        before = min(
+            timeit.repeat(
+                lambda: json.dumps(get_blocks(notification, updated)),
+                number=args.number,
+                repeat=5,
+            )
+        )
+        after = min(
+            timeit.repeat(
+                lambda: render_blocks(notification, updated),
+                number=args.number,
+                repeat=5,
+            )
+        )
+        print(
+            f"{name:<24} get_blocks+dumps {before / args.number * 1e6:7.2f}us  "
+            f"render_blocks {after / args.number * 1e6:7.2f}us  "
+            f"({before / after:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
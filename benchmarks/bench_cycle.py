@@ -0,0 +1,214 @@
+"""
+End-to-end polling cycle benchmark against local GitHub and Slack stand-ins.
+
+For each dataset size the users are stored in a fresh database and polled for
+one initial cycle (every thread is new) and then `--cycles` steady-state
+cycles, with `--update-rate` of the threads getting new activity between
+cycles. Each cycle does the same work as `notify_users_by_slack`, but users are
+passed to `main()` one at a time so that per-user latency can be measured.
+
+    python -m benchmarks.bench_cycle --users 10,100,1000 --output before.json
+    python -m benchmarks.bench_cycle --users 10,100,1000 --compare before.json
+
+Results are deterministic in everything but timing for a given set of
+arguments, so two runs with the same arguments can be compared.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.datasets import seed
+from benchmarks.fakes import FakeGitHub, FakeSlack, GitHubBehaviour
+from data.base import DataManager
+from data.json_manager import JsonManager
+from data.sqlite_manager import SQLiteManager
+from notifications import github_funcs
+from notifications.main_task import main
+from notifications.notify_slack import notify_slack
+from notifications.slack_client import get_client
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def make_manager(storage: str, directory: str) -> DataManager:
+    if storage == "json":
+        return JsonManager(directory)
+    return SQLiteManager(str(Path(directory) / "users.db"))
+
+
+def run_cycle(data_manager: DataManager, github: FakeGitHub, slack: FakeSlack):
+    start = time.perf_counter()
+    users = data_manager.get_users()
+    loaded = time.perf_counter()
+    latencies = []
+    for user in users:
+        user_start = time.perf_counter()
+        main([user], notify_slack)
+        latencies.append(time.perf_counter() - user_start)
+    polled = time.perf_counter()
+    data_manager.save_poll_results(users)
+    end = time.perf_counter()
+    github_calls = github.reset_counts()
+    slack_calls = slack.reset_counts()
+    return {
+        "seconds": end - start,
+        "load_seconds": loaded - start,
+        "save_seconds": end - polled,
+        "users_per_second": len(users) / (end - start) if users else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "github_calls": sum(github_calls.values()),
+        "github_calls_by_endpoint": dict(sorted(github_calls.items())),
+        "slack_calls": sum(slack_calls.values()),
+    }
+
+
+def summarise(cycles: list[dict]) -> dict:
+    keys = ["seconds", "users_per_second", "p50_ms", "p99_ms", "github_calls"]
+    keys += ["slack_calls", "load_seconds", "save_seconds"]
+    return {k: statistics.median(c[k] for c in cycles) for k in keys}
+
+
+def run(args) -> dict:
+    behaviour = GitHubBehaviour(
+        threads_per_user=args.threads,
+        per_page=args.per_page,
+        latency=args.github_latency,
+        jitter=args.github_jitter,
+        update_rate=args.update_rate,
+        seed=args.seed,
+    )
+    results = []
+    with FakeGitHub(behaviour) as github, FakeSlack(args.slack_latency) as slack:
+        github_funcs.NOTIFICATIONS_URL = f"{github.url}/notifications"
+        os.environ["SLACK_API_URL"] = slack.api_url
+        os.environ.setdefault("SLACK_BOT_TOKEN", "xoxb-benchmark")
+        get_client.cache_clear()
+        for size in args.users:
+            github.cycle = 0
+            github.reset_rate_limits()
+            with tempfile.TemporaryDirectory() as directory:
+                data_manager = make_manager(args.storage, directory)
+                seed(data_manager, size)
+                initial = run_cycle(data_manager, github, slack)
+                steady = []
+                for _ in range(args.cycles):
+                    github.advance()
+                    steady.append(run_cycle(data_manager, github, slack))
+            result = {
+                "users": size,
+                "initial": initial,
+                "steady": summarise(steady),
+                "cycles": steady,
+            }
+            results.append(result)
+            print_result(result, file=sys.stderr)
+    return {"meta": metadata(args), "results": results}
+
+
+def metadata(args) -> dict:
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except OSError:
+        revision = ""
+    return {
+        "revision": revision,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+    }
+
+
+def print_result(result: dict, file=sys.stdout):
+    s = result["steady"]
+    print(
+        f"{result['users']:>6} users  initial {result['initial']['seconds']:8.2f}s  "
+        f"steady {s['seconds']:8.2f}s  {s['users_per_second']:8.1f} users/s  "
+        f"p50 {s['p50_ms']:7.2f}ms  p99 {s['p99_ms']:7.2f}ms  "
+        f"github {s['github_calls']:>7.0f}  slack {s['slack_calls']:>6.0f} calls/cycle",
+        file=file,
+    )
+
+
+def compare(current: dict, baseline: dict):
+    base = {r["users"]: r["steady"] for r in baseline["results"]}
+    print(
+        f"compared with {baseline['meta'].get('revision') or 'baseline'} "
+        f"({baseline['meta'].get('timestamp', '?')})"
+    )
+    for result in current["results"]:
+        before = base.get(result["users"])
+        if before is None:
+            continue
+        after = result["steady"]
+        print(
+            f"{result['users']:>6} users  "
+            + "  ".join(
+                f"{key} {before[key]:.2f} -> {after[key]:.2f} ({_change(before[key], after[key])})"
+                for key in ("users_per_second", "p50_ms", "p99_ms", "github_calls")
+            )
+        )
+
+
+def _change(before: float, after: float) -> str:
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--users",
+        type=lambda s: [int(n) for n in s.split(",")],
+        default=[10, 100, 1000],
+        help="comma separated dataset sizes (up to 10000)",
+    )
+    parser.add_argument("--threads", type=int, default=10, help="threads per user")
+    parser.add_argument("--per-page", type=int, default=50)
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--update-rate", type=float, default=0.1)
+    parser.add_argument("--github-latency", type=float, default=0.0)
+    parser.add_argument("--github-jitter", type=float, default=0.0)
+    parser.add_argument("--slack-latency", type=float, default=0.0)
+    parser.add_argument("--storage", choices=("sqlite", "json"), default="sqlite")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="previous --output file to compare with")
+    return parser.parse_args(argv)
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    for result in results["results"]:
+        print_result(result)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    if args.compare:
+        compare(results, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == "__main__":
+    cli()
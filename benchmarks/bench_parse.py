@@ -0,0 +1,92 @@
+"""
+CPU time and peak memory of parsing `/notifications` pages: orjson plus
+`slim_notification`, as in `get_notifications_json`, against `response.json()`.
+
+Pages are built with the same payload generator as the fake GitHub server and
+fed to real `requests.Response` objects from memory, so no network is involved.
+
+    python -m benchmarks.bench_parse [--pages 200] [--per-page 50]
+"""
+
+import argparse
+import io
+import json
+import time
+import tracemalloc
+
+from requests import Response
+
+from benchmarks.fakes import FakeGitHub
+from data import codec
+from notifications.github_funcs import slim_notification
+
+
+def make_pages(pages: int, per_page: int) -> list[bytes]:
+    github = FakeGitHub()
+    try:
+        return [
+            json.dumps(
+                [github.thread(page, thread) for thread in range(per_page)]
+            ).encode()
+            for page in range(pages)
+        ]
+    finally:
+        github.stop()
+
+
+def response_for(body: bytes) -> Response:
+    response = Response()
+    response.status_code = 200
+    response.encoding = "utf-8"
+    response.raw = io.BytesIO(body)
+    return response
+
+
+def parse_whole(body: bytes) -> list[dict]:
+    """What get_notifications_json did before: everything becomes Python objects"""
+    return response_for(body).json()
+
+
+def parse_slim(body: bytes) -> list[dict]:
+    return [slim_notification(n) for n in codec.loads(response_for(body).content)]
+
+
+def measure(parse, pages: list[bytes]) -> tuple[float, int, int]:
+    """CPU seconds for all pages, and the peak/retained bytes for one page"""
+    start = time.process_time()
+    for body in pages:
+        parse(body)
+    cpu = time.process_time() - start
+    tracemalloc.start()
+    result = parse(pages[0])
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return cpu, peak, retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--per-page", type=int, default=50)
+    args = parser.parse_args()
+    pages = make_pages(args.pages, args.per_page)
+    for body in pages[:5]:
+        assert parse_slim(body) == [slim_notification(n) for n in parse_whole(body)]
+    print(
+        f"{args.pages} pages of {args.per_page} notifications, "
+        f"{sum(map(len, pages)) / len(pages) / 1024:.0f}KiB per page"
+    )
+    for name, parse in (
+        ("response.json()", parse_whole),
+        ("orjson + slim", parse_slim),
+    ):
+        cpu, peak, retained = measure(parse, pages)
+        print(
+            f"{name:<16} cpu {cpu / len(pages) * 1000:6.2f}ms/page  "
+            f"peak {peak / 1024:8.0f}KiB  retained {retained / 1024:7.0f}KiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
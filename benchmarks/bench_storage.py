@@ -0,0 +1,231 @@
+"""
+Round-trip checks and timings for stored user state.
+
+First verifies, for SQLiteManager and JsonManager, that:
+
+- data in the previous format (`json.dumps(model_dump(), default=str)`) loads
+  into the same users,
+- data written by the current managers loads back into the same users, and
+- it still validates through the plain pydantic models (what older code reads).
+
+Then times get_users (for everyone and for a single tier) and save_all against
+the previous implementation. Both validate notifications with pydantic, so a
+full get_users is about on par; the gains come from the `where` predicate,
+which leaves other tiers' notifications undecoded, and from orjson.
+
+    python -m benchmarks.bench_storage [--users 1000] [--notifications 50]
+"""
+
+import argparse
+import gc
+import json
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from data import codec
+from data.json_manager import JsonManager
+from data.sqlite_manager import SQLiteManager
+from data.user import Config, User
+from notifications.models import Comment, Notification
+
+
+def make_users(count: int, notifications: int) -> list[User]:
+    start = datetime(2024, 1, 1, 12, 30)
+    users = []
+    for i in range(count):
+        users.append(
+            User(
+                user_id=f"U{i:07d}",
+                username=f"user{i}",
+                token=f"tok-{i}",
+                config=Config(frequency=(None, 1, 5, 15)[i % 4]),
+                notifications=[
+                    Notification(
+                        id=i * 1000 + j,
+                        slack_user_id=f"U{i:07d}",
+                        repo=f"org/repo-{j % 7}",
+                        title=f'Thread {j} — "quoted" ünïcode',
+                        reason="review_requested",
+                        url=f"https://github.com/org/repo-{j % 7}/pull/{j}",
+                        # mix whole seconds, microseconds and aware datetimes
+                        updated_at=(
+                            start + timedelta(minutes=j, microseconds=j % 3 * 1001)
+                        ).replace(tzinfo=timezone.utc if j % 5 == 0 else None),
+                        thread_url=f"https://api.github.com/notifications/threads/{j}",
+                        latest_comment=(
+                            Comment(j, "body\n" * (j % 4), "octocat", f"https://x/{j}")
+                            if j % 2
+                            else None
+                        ),
+                    )
+                    for j in range(notifications)
+                ],
+            )
+        )
+    return users
+
+
+# -- previous implementation -------------------------------------------------
+
+LEGACY_REPLACE_USER = "REPLACE INTO users (user_id, username, token, config, notifications) VALUES (?, ?, ?, ?, ?)"
+
+
+def legacy_sqlite_save_all(path: str, users: list[User]):
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        LEGACY_REPLACE_USER,
+        [
+            (
+                u.user_id,
+                u.username,
+                u.token,
+                u.config.model_dump_json(),
+                json.dumps([n.model_dump() for n in u.notifications], default=str),
+            )
+            for u in users
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+
+def legacy_sqlite_get_users(path: str) -> list[User]:
+    conn = sqlite3.connect(path)
+    rows = conn.execute(
+        "SELECT user_id, username, token, config, notifications FROM users"
+    ).fetchall()
+    conn.close()
+    return [
+        User(
+            user_id=r[0],
+            username=r[1],
+            token=r[2],
+            config=json.loads(r[3]),
+            notifications=json.loads(r[4]),
+        )
+        for r in rows
+    ]
+
+
+def legacy_json_save_all(file: Path, users: list[User]):
+    with file.open("w") as f:
+        json.dump(
+            {u.user_id: u.model_dump(exclude={"state"}) for u in users},
+            f,
+            indent=2,
+            default=str,
+        )
+
+
+def legacy_json_get_users(file: Path) -> list[User]:
+    with file.open("r") as f:
+        return [User(**u) for u in json.load(f).values()]
+
+
+# -----------------------------------------------------------------------------
+
+
+def assert_same(expected: list[User], actual: list[User], context: str):
+    expected = sorted(expected, key=lambda u: u.user_id)
+    actual = sorted(actual, key=lambda u: u.user_id)
+    assert len(expected) == len(actual), context
+    for e, a in zip(expected, actual):
+        assert e.model_dump() == a.model_dump(), f"{context}: {e.user_id} differs"
+        for n in a.notifications:
+            assert isinstance(n.updated_at, datetime), context
+            assert n.latest_comment is None or isinstance(n.latest_comment, Comment)
+
+
+def check_round_trips(users: list[User]):
+    with tempfile.TemporaryDirectory() as directory:
+        db = str(Path(directory) / "users.db")
+        manager = SQLiteManager(db)
+        legacy_sqlite_save_all(db, users)
+        assert_same(users, manager.get_users(), "sqlite: previous format")
+        assert_same(users[:1], [manager.get(users[0].user_id)], "sqlite: get")
+        manager.save_all(manager.get_users())
+        assert_same(users, manager.get_users(), "sqlite: current format")
+        assert_same(users, legacy_sqlite_get_users(db), "sqlite: validated read")
+
+    with tempfile.TemporaryDirectory() as directory:
+        manager = JsonManager(directory)
+        legacy_json_save_all(manager.file, users)
+        assert_same(users, manager.get_users(), "json: previous format")
+        assert_same(users[:1], [manager.get(users[0].user_id)], "json: get")
+        manager.save_all(manager.get_users())
+        assert_same(users, manager.get_users(), "json: current format")
+        assert_same(users, legacy_json_get_users(manager.file), "json: validated read")
+    print(f"round trips OK (orjson {'enabled' if codec.orjson else 'not installed'})")
+
+
+def best_of(fn, repeat: int = 5) -> float:
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def report(name: str, before: float, after: float):
+    print(
+        f"{name:<22} previous {before * 1000:9.1f}ms  current {after * 1000:9.1f}ms  "
+        f"({before / after:.1f}x)"
+    )
+
+
+def time_storage(users: list[User]):
+    with tempfile.TemporaryDirectory() as directory:
+        db = str(Path(directory) / "users.db")
+        manager = SQLiteManager(db)
+        manager.save_all(users)
+        report(
+            "sqlite get_users",
+            best_of(lambda: legacy_sqlite_get_users(db)),
+            best_of(manager.get_users),
+        )
+        report(
+            "sqlite one tier",
+            best_of(
+                lambda: [
+                    u for u in legacy_sqlite_get_users(db) if u.config.frequency == 5
+                ]
+            ),
+            best_of(lambda: manager.get_users(lambda u: u.config.frequency == 5)),
+        )
+        report(
+            "sqlite save_all",
+            best_of(lambda: legacy_sqlite_save_all(db, users)),
+            best_of(lambda: manager.save_all(users)),
+        )
+
+    with tempfile.TemporaryDirectory() as directory:
+        manager = JsonManager(directory)
+        manager.save_all(users)
+        report(
+            "json get_users",
+            best_of(lambda: legacy_json_get_users(manager.file)),
+            best_of(manager.get_users),
+        )
+        report(
+            "json save_all",
+            best_of(lambda: legacy_json_save_all(manager.file, users)),
+            best_of(lambda: manager.save_all(users)),
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--notifications", type=int, default=50)
+    args = parser.parse_args()
+    check_round_trips(make_users(20, 12))
+    time_storage(make_users(args.users, args.notifications))
+
+
+if __name__ == "__main__":
+    main()
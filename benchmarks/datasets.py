@@ -0,0 +1,25 @@
+"""Synthetic users matching the tokens understood by `benchmarks.fakes.FakeGitHub`"""
+
+from data.base import DataManager
+from data.user import Config, User
+
+SIZES = (10, 100, 1_000, 10_000)
+FREQUENCIES = (1, 5, 10, 15, 30)
+
+
+def make_users(count: int) -> list[User]:
+    return [
+        User(
+            user_id=f"U{i:07d}",
+            username=f"user{i}",
+            token=f"tok-{i}",
+            config=Config(frequency=FREQUENCIES[i % len(FREQUENCIES)]),
+        )
+        for i in range(count)
+    ]
+
+
+def seed(data_manager: DataManager, count: int) -> list[User]:
+    users = make_users(count)
+    data_manager.save_all(users)
+    return users
@@ -0,0 +1,435 @@
+"""
+Local stand-ins for the GitHub and Slack APIs, served over real HTTP so the
+benchmarks exercise the same client code as production.
+
+`FakeGitHub` serves `/notifications` (paginated, with Last-Modified/304 and
+rate-limit headers), latest-comment URLs and the thread endpoints. Thread
+contents are derived deterministically from the seed, the user's token and
+the current cycle, so a given configuration produces the same traffic on
+every run. `FakeSlack` accepts any Web API method and answers `{"ok": true}`.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+# Fields copied verbatim into every payload so responses are as large as GitHub's
+REPOSITORY_URL_FIELDS = [
+    "archive_url",
+    "assignees_url",
+    "blobs_url",
+    "branches_url",
+    "collaborators_url",
+    "comments_url",
+    "commits_url",
+    "compare_url",
+    "contents_url",
+    "contributors_url",
+    "deployments_url",
+    "downloads_url",
+    "events_url",
+    "forks_url",
+    "git_commits_url",
+    "git_refs_url",
+    "git_tags_url",
+    "issue_comment_url",
+    "issue_events_url",
+    "issues_url",
+    "keys_url",
+    "labels_url",
+    "languages_url",
+    "merges_url",
+    "milestones_url",
+    "notifications_url",
+    "pulls_url",
+    "releases_url",
+    "stargazers_url",
+    "statuses_url",
+    "subscribers_url",
+    "subscription_url",
+    "tags_url",
+    "teams_url",
+    "trees_url",
+    "hooks_url",
+]
+OWNER_URL_FIELDS = [
+    "url",
+    "html_url",
+    "followers_url",
+    "following_url",
+    "gists_url",
+    "starred_url",
+    "subscriptions_url",
+    "organizations_url",
+    "repos_url",
+    "events_url",
+    "received_events_url",
+]
+REASONS = [
+    "review_requested",
+    "mention",
+    "subscribed",
+    "author",
+    "comment",
+    "team_mention",
+    "ci_activity",
+]
+THREAD_ID_STRIDE = 100_000
+
+
+def _fraction(*parts) -> float:
+    """Deterministic pseudo-random number in [0, 1) for the given key"""
+    return zlib.crc32(":".join(map(str, parts)).encode()) / 2**32
+
+
+@dataclass
+class GitHubBehaviour:
+    threads_per_user: int = 10
+    per_page: int = 50
+    # seconds added to every response, plus up to `jitter` seconds at random
+    latency: float = 0.0
+    jitter: float = 0.0
+    # fraction of threads that get a new comment each cycle
+    update_rate: float = 0.1
+    rate_limit: int = 5000
+    repos: int = 50
+    seed: int = 0
+
+
+class _FakeServer:
+    def __init__(self, handler: type[BaseHTTPRequestHandler]):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.calls[key] += 1
+
+    def reset_counts(self) -> Counter:
+        with self._lock:
+            calls, self.calls = self.calls, Counter()
+        return calls
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self.httpd.shutdown()
+            self._thread = None
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def send_json(self, status: int, body, headers: dict | None = None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        if body is not None:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _GitHubHandler(_Handler):
+    def do_GET(self):
+        self.fake.handle(self, "GET")
+
+    def do_PATCH(self):
+        self.fake.handle(self, "PATCH")
+
+    def do_PUT(self):
+        self.fake.handle(self, "PUT")
+
+    def do_DELETE(self):
+        self.fake.handle(self, "DELETE")
+
+
+class FakeGitHub(_FakeServer):
+    routes = [
+        ("GET", re.compile(r"^/notifications$"), "notifications"),
+        ("PUT", re.compile(r"^/notifications$"), "mark_all_read"),
+        ("PATCH", re.compile(r"^/notifications/threads/(\d+)$"), "thread"),
+        (
+            "PUT",
+            re.compile(r"^/notifications/threads/(\d+)/subscription$"),
+            "subscription",
+        ),
+        (
+            "PUT",
+            re.compile(r"^/repos/([^/]+/[^/]+)/notifications$"),
+            "mark_repo_read",
+        ),
+        (
+            "GET",
+            re.compile(r"^/repos/([^/]+/[^/]+)/issues/comments/(\d+)$"),
+            "comment",
+        ),
+        ("GET", re.compile(r"^/repos/([^/]+/[^/]+)/issues/(\d+)$"), "issue"),
+    ]
+
+    def __init__(self, behaviour: GitHubBehaviour | None = None):
+        super().__init__(_GitHubHandler)
+        self.behaviour = behaviour or GitHubBehaviour()
+        self.cycle = 0
+        self.remaining: dict[str, int] = {}
+
+    def advance(self, cycles: int = 1) -> None:
+        """Move time forward so that some threads get new activity"""
+        self.cycle += cycles
+
+    def reset_rate_limits(self) -> None:
+        self.remaining.clear()
+
+    # -- payloads -------------------------------------------------------------
+
+    def repo_name(self, user: int, thread: int) -> str:
+        b = self.behaviour
+        index = int(_fraction(b.seed, "repo", user, thread) * b.repos)
+        return f"org{index % 7}/repo-{index}"
+
+    def last_update(self, user: int, thread: int) -> int:
+        """The latest cycle (<= now) in which the thread had activity"""
+        b = self.behaviour
+        for cycle in range(self.cycle, 0, -1):
+            if _fraction(b.seed, user, thread, cycle) < b.update_rate:
+                return cycle
+        return 0
+
+    def updated_at(self, user: int, thread: int) -> datetime:
+        return EPOCH + timedelta(minutes=self.last_update(user, thread), seconds=thread)
+
+    def repository(self, full_name: str) -> dict:
+        owner, name = full_name.split("/")
+        api = f"{self.url}/repos/{full_name}"
+        repo = {
+            "id": zlib.crc32(full_name.encode()),
+            "node_id": "MDEwOlJlcG9zaXRvcnkxMjk2MjY5",
+            "name": name,
+            "full_name": full_name,
+            "owner": {
+                "login": owner,
+                "id": zlib.crc32(owner.encode()),
+                "node_id": "MDQ6VXNlcjE=",
+                "avatar_url": "https://github.com/images/error/octocat_happy.gif",
+                "gravatar_id": "",
+                "type": "Organization",
+                "site_admin": False,
+                **{f: f"{self.url}/users/{owner}/{f}" for f in OWNER_URL_FIELDS},
+            },
+            "private": False,
+            "html_url": f"https://github.com/{full_name}",
+            "description": "Synthetic benchmark repository",
+            "fork": False,
+            "url": api,
+            "git_url": f"git:github.com/{full_name}.git",
+            "ssh_url": f"git@github.com:{full_name}.git",
+        }
+        repo.update({f: f"{api}/{f}" for f in REPOSITORY_URL_FIELDS})
+        return repo
+
+    def thread(self, user: int, thread: int) -> dict:
+        thread_id = user * THREAD_ID_STRIDE + thread
+        repo = self.repo_name(user, thread)
+        last_update = self.last_update(user, thread)
+        updated_at = self.updated_at(user, thread).strftime("%Y-%m-%dT%H:%M:%SZ")
+        comment_id = thread_id * 1000 + last_update
+        return {
+            "id": str(thread_id),
+            "repository": self.repository(repo),
+            "subject": {
+                "title": f"Synthetic thread {thread} for user {user}",
+                "url": f"{self.url}/repos/{repo}/issues/{thread_id}",
+                "latest_comment_url": f"{self.url}/repos/{repo}/issues/comments/{comment_id}",
+                "type": "Issue",
+            },
+            "reason": REASONS[
+                int(
+                    _fraction(self.behaviour.seed, "reason", user, thread)
+                    * len(REASONS)
+                )
+            ],
+            "unread": True,
+            "updated_at": updated_at,
+            "last_read_at": updated_at,
+            "url": f"{self.url}/notifications/threads/{thread_id}",
+            "subscription_url": f"{self.url}/notifications/threads/{thread_id}/subscription",
+        }
+
+    def comment(self, repo: str, comment_id: int) -> dict:
+        return {
+            "id": comment_id,
+            "body": f"Comment {comment_id}: " + "lorem ipsum dolor sit amet " * 8,
+            "user": {"login": f"reviewer-{comment_id % 17}"},
+            "html_url": f"https://github.com/{repo}/issues/{comment_id // 1000}#issuecomment-{comment_id}",
+        }
+
+    # -- request handling -----------------------------------------------------
+
+    def user_for(self, handler: _Handler) -> int | None:
+        auth = handler.headers.get("Authorization", "")
+        match = re.fullmatch(r"Bearer tok-(\d+)", auth)
+        return int(match.group(1)) if match else None
+
+    def rate_limit_headers(self, token: str) -> dict:
+        remaining = self.remaining.get(token, self.behaviour.rate_limit)
+        remaining = max(remaining - 1, 0)
+        self.remaining[token] = remaining
+        return {
+            "X-RateLimit-Limit": str(self.behaviour.rate_limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(int(time.time()) + 3600),
+        }
+
+    def handle(self, handler: _Handler, method: str):
+        b = self.behaviour
+        if b.latency or b.jitter:
+            time.sleep(b.latency + random.random() * b.jitter)
+        parsed = urlparse(handler.path)
+        user = self.user_for(handler)
+        if user is None:
+            self.count("unauthorized")
+            handler.send_json(401, {"message": "Bad credentials"})
+            return
+        if method in ("PATCH", "PUT", "DELETE"):
+            handler.read_body()
+        headers = self.rate_limit_headers(handler.headers["Authorization"])
+        if headers["X-RateLimit-Remaining"] == "0":
+            self.count("rate_limited")
+            handler.send_json(403, {"message": "API rate limit exceeded"}, headers)
+            return
+        for route_method, pattern, name in self.routes:
+            match = pattern.match(parsed.path)
+            if route_method == method and match:
+                self.count(name)
+                getattr(self, f"handle_{name}")(handler, user, headers, match, parsed)
+                return
+        self.count("not_found")
+        handler.send_json(404, {"message": "Not Found"}, headers)
+
+    def handle_notifications(self, handler, user, headers, match, parsed):
+        b = self.behaviour
+        query = parse_qs(parsed.query)
+        page = int(query.get("page", ["1"])[0])
+        per_page = int(query.get("per_page", [str(b.per_page)])[0])
+        threads = sorted(
+            range(b.threads_per_user),
+            key=lambda t: self.updated_at(user, t),
+            reverse=True,
+        )
+        last_modified = format_datetime(
+            max((self.updated_at(user, t) for t in threads), default=EPOCH),
+            usegmt=True,
+        )
+        headers = {**headers, "Last-Modified": last_modified, "X-Poll-Interval": "60"}
+        since = handler.headers.get("If-Modified-Since")
+        if since and parsedate_to_datetime(since) >= parsedate_to_datetime(
+            last_modified
+        ):
+            self.count("not_modified")
+            handler.send_json(304, None, headers)
+            return
+        start = (page - 1) * per_page
+        body = [self.thread(user, t) for t in threads[start : start + per_page]]
+        if start + per_page < len(threads):
+            headers["Link"] = (
+                f'<{self.url}/notifications?page={page + 1}&per_page={per_page}>; rel="next"'
+            )
+        handler.send_json(200, body, headers)
+
+    def handle_comment(self, handler, user, headers, match, parsed):
+        handler.send_json(
+            200, self.comment(match.group(1), int(match.group(2))), headers
+        )
+
+    def handle_issue(self, handler, user, headers, match, parsed):
+        repo, number = match.group(1), int(match.group(2))
+        handler.send_json(
+            200,
+            {
+                "id": number,
+                "body": "Issue description",
+                "user": {"login": "author"},
+                "html_url": f"https://github.com/{repo}/issues/{number}",
+            },
+            headers,
+        )
+
+    def handle_thread(self, handler, user, headers, match, parsed):
+        handler.send_json(205, None, headers)
+
+    def handle_subscription(self, handler, user, headers, match, parsed):
+        handler.send_json(200, {"subscribed": False, "ignored": True}, headers)
+
+    def handle_mark_all_read(self, handler, user, headers, match, parsed):
+        handler.send_json(205, None, headers)
+
+    def handle_mark_repo_read(self, handler, user, headers, match, parsed):
+        handler.send_json(205, None, headers)
+
+
+class _SlackHandler(_Handler):
+    def do_POST(self):
+        fake = self.fake
+        if fake.latency:
+            time.sleep(fake.latency)
+        self.read_body()
+        method = self.path.rsplit("/", 1)[-1]
+        fake.count(method)
+        self.send_json(
+            200,
+            {"ok": True, "channel": "D0000000", "ts": f"{time.time():.6f}"},
+        )
+
+
+class FakeSlack(_FakeServer):
+    def __init__(self, latency: float = 0.0):
+        super().__init__(_SlackHandler)
+        self.latency = latency
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.url}/api/"
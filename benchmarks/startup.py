@@ -0,0 +1,104 @@
+"""
+Import-time benchmark for the app and worker entry points.
+
+Each module is imported in a fresh interpreter (from an empty working directory,
+so a stray `users.db` shows up as a side effect) and the wall time of the import
+is reported along with the modules with the highest self time from `-X importtime`.
+
+    python -m benchmarks.startup [--runs 10] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+MODULES = ["app", "worker", "notifications.main_task", "data"]
+
+PROBE = """
+import sys, threading, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, threading.active_count())
+"""
+
+
+def time_import(module: str, cwd: str) -> tuple[float, int]:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module)],
+        cwd=cwd,
+        env={**os.environ, "PYTHONPATH": str(ROOT)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed, threads = result.stdout.split()
+    return float(elapsed), int(threads)
+
+
+def slowest_imports(module: str, cwd: str, top: int = 5) -> list[tuple[int, str]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        env={**os.environ, "PYTHONPATH": str(ROOT)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, _, name = line[len("import time:") :].split("|")
+        rows.append((int(own), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def run(runs: int) -> dict:
+    results = {}
+    for module in MODULES:
+        with tempfile.TemporaryDirectory() as cwd:
+            samples = []
+            threads = 0
+            for _ in range(runs):
+                elapsed, threads = time_import(module, cwd)
+                samples.append(elapsed * 1000)
+            results[module] = {
+                "median_ms": round(statistics.median(samples), 1),
+                "min_ms": round(min(samples), 1),
+                "threads": threads,
+                "created_files": sorted(os.listdir(cwd)),
+                "slowest": [
+                    {"module": name, "self_ms": round(us / 1000, 1)}
+                    for us, name in slowest_imports(module, cwd)
+                ],
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="print raw JSON")
+    args = parser.parse_args()
+    results = run(args.runs)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for module, r in results.items():
+        print(
+            f"{module:<26} median {r['median_ms']:>7.1f}ms  min {r['min_ms']:>7.1f}ms  "
+            f"threads {r['threads']}  files {r['created_files'] or '-'}"
+        )
+        for s in r["slowest"]:
+            print(f"    {s['self_ms']:>7.1f}ms  {s['module']}")
+
+
+if __name__ == "__main__":
+    main()
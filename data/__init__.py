@@ -1,3 +1,20 @@
-from data.sqlite_manager import SQLiteManager
+from functools import cache
 
-data_manager = SQLiteManager("./users.db")
+from data.base import DataManager
+
+DATABASE_PATH = "./users.db"
+
+
+@cache
+def get_data_manager() -> DataManager:
+    """The shared data manager, created (along with the database) on first use"""
+    from data.sqlite_manager import SQLiteManager
+
+    return SQLiteManager(DATABASE_PATH)
+
+
+def __getattr__(name: str):
+    # keeps `from data import data_manager` working without connecting at import time
+    if name == "data_manager":
+        return get_data_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
+from typing import Callable, Optional
 
-from data.user import User
+from data.user import Config, User
 
 
 class DataManager(ABC):
@@ -17,7 +18,11 @@ class DataManager(ABC):
         pass
 
     @abstractmethod
-    def get_users(self) -> list[User]:
+    def get_users(self, where: Optional[Callable[[User], bool]] = None) -> list[User]:
+        """
+        All users, or those matching `where`. The predicate sees each user before
+        their notifications are loaded, so unselected users' history is never decoded.
+        """
         pass
 
     @abstractmethod
@@ -35,3 +40,39 @@ class DataManager(ABC):
     @abstractmethod
     def save_all(self, users: list[User]) -> None:
         pass
+
+    @abstractmethod
+    def save_poll_results(self, users: list[User]) -> None:
+        """
+        Store what a poll cycle changes, `notifications` and `state`, for users that
+        still exist. The other fields may have been changed by the web app during
+        the cycle, so they are left alone.
+        """
+        pass
+
+    @abstractmethod
+    def save_config(self, user_id: str, config: Config) -> None:
+        """Store a user's config alone (the poller owns the other fields)"""
+        pass
+
+    @abstractmethod
+    def rotate_tokens(self, rotate: Callable[[str], str]) -> int:
+        """
+        Replace every stored token value with `rotate(value)`, leaving tokens saved
+        meanwhile alone; returns how many were replaced
+        """
+        pass
+
+    @abstractmethod
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Take or renew the named lease for `owner`; False if someone else holds it"""
+        pass
+
+    @abstractmethod
+    def release_lease(self, name: str, owner: str) -> None:
+        pass
+
+    @abstractmethod
+    def get_leases(self, prefix: str) -> dict[str, str]:
+        """Unexpired leases whose name starts with `prefix`, as name -> owner"""
+        pass
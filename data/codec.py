@@ -0,0 +1,131 @@
+"""
+Encoding of stored user state.
+
+Users are assembled with `User.model_construct` from parts that are validated
+on their own: notifications in one pass through a cached `TypeAdapter`, which
+raises `ValidationError` for corrupt data.
+
+orjson is used when installed; the stdlib fallback produces the same format.
+Tokens are encrypted on the way in and out, see `data.crypto`.
+"""
+
+import dataclasses
+import json
+from datetime import datetime
+from functools import cache
+from typing import Any, Optional
+
+from pydantic import TypeAdapter
+
+from data import crypto
+from data.user import Config, PollState, User
+from notifications.models import Notification
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def _default(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if dataclasses.is_dataclass(obj):
+        return dataclasses.asdict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any, indent: bool = False) -> str:
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2 if indent else 0
+        return orjson.dumps(obj, default=_default, option=option).decode()
+    if indent:
+        return json.dumps(obj, default=_default, indent=2)
+    return json.dumps(obj, default=_default, separators=(",", ":"))
+
+
+def loads(data: str | bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def notification_to_dict(n: Notification) -> dict:
+    return {
+        "id": n.id,
+        "slack_user_id": n.slack_user_id,
+        "repo": n.repo,
+        "title": n.title,
+        "reason": n.reason,
+        "url": n.url,
+        "updated_at": n.updated_at,
+        "thread_url": n.thread_url,
+        "latest_comment": n.latest_comment,
+    }
+
+
+def config_to_dict(config: Config) -> dict:
+    return config.model_dump(mode="json")
+
+
+def state_to_dict(state: PollState) -> dict:
+    return state.model_dump(mode="json")
+
+
+def user_to_dict(user: User) -> dict:
+    return {
+        "user_id": user.user_id,
+        "username": user.username,
+        "token": crypto.encrypt_token(user.token),
+        "config": config_to_dict(user.config),
+        "notifications": [notification_to_dict(n) for n in user.notifications],
+        "state": state_to_dict(user.state),
+    }
+
+
+@cache
+def _notifications_adapter() -> TypeAdapter:
+    return TypeAdapter(list[Notification])
+
+
+def notifications_from_list(items: list[dict]) -> list[Notification]:
+    return _notifications_adapter().validate_python(items)
+
+
+def config_from_dict(config: Optional[dict]) -> Config:
+    # one small model per user, so it's simply validated
+    return Config.model_validate(config or {})
+
+
+def state_from_dict(state: Optional[dict]) -> PollState:
+    return PollState.model_validate(state or {})
+
+
+def user_from_parts(
+    user_id: str,
+    username: str,
+    token: str,
+    config: Optional[dict],
+    notifications: Optional[list[dict]],
+    state: Optional[dict] = None,
+) -> User:
+    """Rebuild a stored user from its columns (or the keys of its JSON file)"""
+    return User.model_construct(
+        user_id=user_id,
+        username=username,
+        token=crypto.decrypt_token(token),
+        config=config_from_dict(config),
+        notifications=notifications_from_list(notifications or []),
+        state=state_from_dict(state),
+    )
+
+
+def user_from_dict(d: dict) -> User:
+    return user_from_parts(
+        d["user_id"],
+        d["username"],
+        d["token"],
+        d.get("config"),
+        d.get("notifications"),
+        d.get("state"),
+    )
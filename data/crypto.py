@@ -0,0 +1,182 @@
+"""
+Envelope encryption of stored GitHub tokens.
+
+Each token is encrypted with its own random data key, and the data key is
+stored alongside it wrapped by a key-encryption key from the environment:
+
+    TOKEN_ENCRYPTION_KEYS=<newest>,<older>,...   (Fernet keys)
+
+The first key wraps new data keys; all of them can unwrap. Rotating therefore
+only re-wraps the small data keys (`python -m data.rotate_keys`), and the
+token ciphertext itself never changes.
+
+Without keys tokens are stored as they are. Stored plaintext tokens are still
+read, and are encrypted the next time the user is saved (or by rotate_keys).
+A user whose token no key can decrypt is logged and left out of polling, and
+subscribing again replaces the token.
+
+Decrypting costs two Fernet operations per user per cycle, so results are kept
+in memory for TOKEN_CACHE_TTL seconds. Re-saving a token found in the cache
+reuses its ciphertext rather than encrypting it again, provided it is wrapped
+by the newest key (so a running worker can't undo a rotation).
+"""
+
+import logging
+import os
+import threading
+import time
+from functools import cache
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from cryptography.fernet import Fernet, MultiFernet
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "enc:v1:"
+TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", 600))
+TOKEN_CACHE_SIZE = 10000
+
+
+class TokenCache:
+    """A bounded mapping whose entries expire `ttl` seconds after being added"""
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: dict[str, tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            with self._lock:
+                self._entries.pop(key, None)
+            return None
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            if len(self._entries) >= self.maxsize:
+                # dicts keep insertion order, so this drops the oldest entries
+                for old in list(self._entries)[: self.maxsize // 10 or 1]:
+                    del self._entries[old]
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class DecryptionError(Exception):
+    """A stored token can't be decrypted with the configured keys"""
+
+
+# ciphertext -> token, and token -> ciphertext for tokens that are unchanged
+_decrypted = TokenCache(TOKEN_CACHE_TTL, TOKEN_CACHE_SIZE)
+_encrypted = TokenCache(TOKEN_CACHE_TTL, TOKEN_CACHE_SIZE)
+
+
+def _keys_from_env() -> list[bytes]:
+    keys = os.environ.get("TOKEN_ENCRYPTION_KEYS", "")
+    return [k.strip().encode() for k in keys.split(",") if k.strip()]
+
+
+@cache
+def _key_encryption_keys() -> list["Fernet"]:
+    keys = _keys_from_env()
+    if not keys:
+        logger.warning(
+            "TOKEN_ENCRYPTION_KEYS is not set, tokens are stored in plaintext"
+        )
+        return []
+    from cryptography.fernet import Fernet
+
+    return [Fernet(k) for k in keys]
+
+
+@cache
+def get_key_encryption() -> Optional["MultiFernet"]:
+    """None when no keys are configured"""
+    keys = _key_encryption_keys()
+    if not keys:
+        return None
+    from cryptography.fernet import MultiFernet
+
+    return MultiFernet(keys)
+
+
+def _unwrap(wrapped_key: str) -> tuple[bytes, bool]:
+    """The data key, and whether it was wrapped by the newest key"""
+    from cryptography.fernet import InvalidToken
+
+    newest = _key_encryption_keys()[0]
+    try:
+        return newest.decrypt(wrapped_key.encode()), True
+    except InvalidToken:
+        return get_key_encryption().decrypt(wrapped_key.encode()), False
+
+
+def is_encrypted(stored: str) -> bool:
+    return stored.startswith(PREFIX)
+
+
+def encrypt_token(token: str) -> str:
+    """The value to store for `token`"""
+    kek = get_key_encryption()
+    if kek is None:
+        return token
+    stored = _encrypted.get(token)
+    if stored is not None:
+        return stored
+    from cryptography.fernet import Fernet
+
+    data_key = Fernet.generate_key()
+    ciphertext = Fernet(data_key).encrypt(token.encode()).decode()
+    stored = f"{PREFIX}{kek.encrypt(data_key).decode()}:{ciphertext}"
+    _encrypted.set(token, stored)
+    _decrypted.set(stored, token)
+    return stored
+
+
+def decrypt_token(stored: str) -> str:
+    """
+    The token for a stored value; plaintext values are returned unchanged.
+    Raises DecryptionError if none of the keys fits.
+    """
+    if not is_encrypted(stored):
+        return stored
+    token = _decrypted.get(stored)
+    if token is not None:
+        return token
+    if get_key_encryption() is None:
+        raise DecryptionError(
+            "found an encrypted token but TOKEN_ENCRYPTION_KEYS is not set"
+        )
+    from cryptography.fernet import Fernet, InvalidToken
+
+    try:
+        wrapped_key, ciphertext = stored[len(PREFIX) :].split(":")
+        data_key, current = _unwrap(wrapped_key)
+        token = Fernet(data_key).decrypt(ciphertext.encode()).decode()
+    except (InvalidToken, ValueError) as e:
+        # e.g. the key that wrapped it was dropped from TOKEN_ENCRYPTION_KEYS
+        raise DecryptionError("no configured key decrypts the stored token") from e
+    _decrypted.set(stored, token)
+    if current:
+        _encrypted.set(token, stored)
+    return token
+
+
+def rotate_token(stored: str) -> str:
+    """Re-wrap a stored token's data key with the newest key (encrypting plaintext)"""
+    kek = get_key_encryption()
+    if kek is None:
+        raise RuntimeError("TOKEN_ENCRYPTION_KEYS is not set")
+    if not is_encrypted(stored):
+        return encrypt_token(stored)
+    wrapped_key, ciphertext = stored[len(PREFIX) :].split(":")
+    return f"{PREFIX}{kek.rotate(wrapped_key.encode()).decode()}:{ciphertext}"
@@ -1,14 +1,20 @@
 import json
+import logging
 import shutil
 import threading
+import time
 from datetime import datetime
 from pathlib import Path
+from typing import Callable, Optional
 
+from data import codec, crypto
 from data.base import DataManager
-from data.user import User
+from data.user import Config, User
 
+logger = logging.getLogger(__name__)
 
 FILENAME = "data.json"
+LEASES_FILENAME = "leases.json"
 FILE_LOCK = threading.Lock()
 
 
@@ -26,28 +32,29 @@ class JsonManager(DataManager):
                 json.dump({}, f)
         self.path = path
         self.file = main_file
+        self.leases_file = path / LEASES_FILENAME
 
     def subscribe_user(self, user: User) -> None:
         with self.file_lock:
             with self.file.open("r") as f:
-                data = json.load(f)
+                data = codec.loads(f.read())
                 if data.get(user.user_id):
                     # Already subscribed
                     return
-                data[user.user_id] = user.model_dump()
+                data[user.user_id] = codec.user_to_dict(user)
             with self.file.open("w") as f:
-                json.dump(data, f, indent=2)
+                f.write(codec.dumps(data, indent=True))
 
     def unsubscribe_user(self, user_id: str) -> None:
         with self.file_lock:
             with self.file.open("r") as f:
-                data = json.load(f)
+                data = codec.loads(f.read())
                 try:
                     del data[user_id]
                 except KeyError:
                     pass
             with self.file.open("w") as f:
-                json.dump(data, f, indent=2)
+                f.write(codec.dumps(data, indent=True))
 
     def backup(self) -> None:
         with self.file_lock:
@@ -56,35 +63,122 @@ class JsonManager(DataManager):
                 self.path / f"{FILENAME}.bak-{datetime.now().strftime('%Y%m%d-%H%M')}",
             )
 
-    def get_users(self) -> list[User]:
+    def get_users(self, where: Optional[Callable[[User], bool]] = None) -> list[User]:
         with self.file_lock:
             with self.file.open("r") as f:
-                data = json.load(f)
-                return [User(**u) for u in data.values()]
+                data = codec.loads(f.read())
+        users = []
+        for user_id, u in data.items():
+            try:
+                user = codec.user_from_dict({**u, "notifications": []})
+            except crypto.DecryptionError as e:
+                # one unreadable token mustn't stop everyone else being polled
+                logger.error("Skipping user %s: %s", user_id, e)
+                continue
+            if where is None or where(user):
+                user.notifications = codec.notifications_from_list(u["notifications"])
+                users.append(user)
+        return users
 
-    def get(self, user_id: str) -> User:
+    def get(self, user_id: str) -> Optional[User]:
         with self.file_lock:
             with self.file.open("r") as f:
-                return User(**json.load(f).get(user_id))
+                data = codec.loads(f.read()).get(user_id)
+                return codec.user_from_dict(data) if data else None
 
     def save(self, user: User) -> None:
         with self.file_lock:
             with self.file.open("r") as f:
-                data = json.load(f)
-                data[user.user_id] = user.model_dump()
+                data = codec.loads(f.read())
+                data[user.user_id] = codec.user_to_dict(user)
             with self.file.open("w") as f:
-                json.dump(data, f, indent=2)
+                f.write(codec.dumps(data, indent=True))
 
     def __getitem__(self, user_id: str) -> User:
         with self.file_lock:
             with self.file.open("r") as f:
-                return User(**(json.load(f)[user_id]))
+                return codec.user_from_dict(codec.loads(f.read())[user_id])
 
     def save_all(self, users: list[User]) -> None:
         with self.file_lock:
-            data = {user.user_id: user.model_dump() for user in users}
+            data = {user.user_id: codec.user_to_dict(user) for user in users}
             with self.file.open("r") as f:
-                local_users = json.load(f)
+                local_users = codec.loads(f.read())
                 local_users.update(data)
             with self.file.open("w") as f:
-                json.dump(local_users, f, indent=2)
+                f.write(codec.dumps(local_users, indent=True))
+
+    def save_poll_results(self, users: list[User]) -> None:
+        with self.file_lock:
+            with self.file.open("r") as f:
+                data = codec.loads(f.read())
+            for user in users:
+                stored = data.get(user.user_id)
+                if stored is None:
+                    # unsubscribed during the cycle
+                    continue
+                stored["notifications"] = [
+                    codec.notification_to_dict(n) for n in user.notifications
+                ]
+                stored["state"] = codec.state_to_dict(user.state)
+            with self.file.open("w") as f:
+                f.write(codec.dumps(data, indent=True))
+
+    def save_config(self, user_id: str, config: Config) -> None:
+        with self.file_lock:
+            with self.file.open("r") as f:
+                data = codec.loads(f.read())
+            if user_id not in data:
+                return
+            data[user_id]["config"] = codec.config_to_dict(config)
+            with self.file.open("w") as f:
+                f.write(codec.dumps(data, indent=True))
+
+    def rotate_tokens(self, rotate: Callable[[str], str]) -> int:
+        with self.file_lock:
+            with self.file.open("r") as f:
+                data = codec.loads(f.read())
+            for u in data.values():
+                u["token"] = rotate(u["token"])
+            with self.file.open("w") as f:
+                f.write(codec.dumps(data, indent=True))
+        return len(data)
+
+    def _read_leases(self) -> dict:
+        if not self.leases_file.exists():
+            return {}
+        with self.leases_file.open("r") as f:
+            return json.load(f)
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        # Only safe between threads of a single process; use SQLiteManager when
+        # running several workers.
+        now = time.time()
+        with self.file_lock:
+            leases = self._read_leases()
+            lease = leases.get(name)
+            if lease and lease["owner"] != owner and lease["expires_at"] >= now:
+                return False
+            leases[name] = {"owner": owner, "expires_at": now + ttl}
+            with self.leases_file.open("w") as f:
+                json.dump(leases, f, indent=2)
+        return True
+
+    def release_lease(self, name: str, owner: str) -> None:
+        with self.file_lock:
+            leases = self._read_leases()
+            if leases.get(name, {}).get("owner") != owner:
+                return
+            del leases[name]
+            with self.leases_file.open("w") as f:
+                json.dump(leases, f, indent=2)
+
+    def get_leases(self, prefix: str) -> dict[str, str]:
+        now = time.time()
+        with self.file_lock:
+            leases = self._read_leases()
+        return {
+            name: lease["owner"]
+            for name, lease in leases.items()
+            if name.startswith(prefix) and lease["expires_at"] >= now
+        }
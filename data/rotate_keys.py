@@ -0,0 +1,52 @@
+"""
+Re-wrap every stored token with the newest TOKEN_ENCRYPTION_KEYS key.
+
+To rotate keys:
+
+1. generate a key with `python -m data.rotate_keys --generate-key`
+2. prepend it to TOKEN_ENCRYPTION_KEYS and restart the app and workers
+3. run `python -m data.rotate_keys` (this also encrypts any plaintext tokens)
+4. drop the old key from TOKEN_ENCRYPTION_KEYS and restart again
+
+    python -m data.rotate_keys [--json-dir ./user_data] [--generate-key]
+"""
+
+import argparse
+import logging
+
+from data import crypto, get_data_manager
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--json-dir", help="rotate a JsonManager directory instead of the database"
+    )
+    parser.add_argument(
+        "--generate-key",
+        action="store_true",
+        help="print a new key and exit",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.generate_key:
+        from cryptography.fernet import Fernet
+
+        print(Fernet.generate_key().decode())
+        return
+
+    if crypto.get_key_encryption() is None:
+        parser.error("TOKEN_ENCRYPTION_KEYS is not set")
+    if args.json_dir:
+        from data.json_manager import JsonManager
+
+        data_manager = JsonManager(args.json_dir)
+    else:
+        data_manager = get_data_manager()
+    count = data_manager.rotate_tokens(crypto.rotate_token)
+    logging.info("re-wrapped %d tokens", count)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,35 @@
-import json
+import logging
 import sqlite3
 import threading
-from typing import Optional
+import time
+from typing import Callable, Optional
 
+from data import codec, crypto
 from data.base import DataManager
-from data.user import User
+from data.user import Config, User
 
+logger = logging.getLogger(__name__)
+
+REPLACE_USER = "REPLACE INTO users (user_id, username, token, config, notifications, state) VALUES (?, ?, ?, ?, ?, ?)"
 
-class SQLiteManager(DataManager):
 
-    _local = threading.local()
+class SQLiteManager(DataManager):
 
     def _initialize_thread_local_connection(self):
-        if not hasattr(SQLiteManager._local, "conn"):
-            SQLiteManager._local.conn = sqlite3.connect(
-                self.path, check_same_thread=False
-            )
-            SQLiteManager._local.path = self.path
+        if not hasattr(self._local, "conn"):
+            self._local.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._local.path = self.path
             self.create_table_if_not_exists()
 
     def get_thread_local_connection(self):
-        if (
-            not hasattr(SQLiteManager._local, "conn")
-            or SQLiteManager._local.conn is None
-        ):
-            SQLiteManager._local.conn = sqlite3.connect(
-                self.path, check_same_thread=False
-            )
-        return SQLiteManager._local.conn
+        if not hasattr(self._local, "conn") or self._local.conn is None:
+            self._local.conn = sqlite3.connect(self.path, check_same_thread=False)
+        return self._local.conn
 
     def __init__(self, path: str):
         self.path = path
+        # per instance, so that managers for different databases don't share connections
+        self._local = threading.local()
         self._initialize_thread_local_connection()
 
     def create_table_if_not_exists(self):
@@ -42,7 +41,21 @@ class SQLiteManager(DataManager):
                 username TEXT,
                 token TEXT,
                 config TEXT,
-                notifications TEXT
+                notifications TEXT,
+                state TEXT
+            )
+        """
+        )
+        # databases created before the state column was added
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(users)")}
+        if "state" not in columns:
+            cursor.execute("ALTER TABLE users ADD COLUMN state TEXT")
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT,
+                expires_at REAL
             )
         """
         )
@@ -54,16 +67,7 @@ class SQLiteManager(DataManager):
 
     def subscribe_user(self, user: User) -> None:
         cursor = self.conn.cursor()
-        cursor.execute(
-            "REPLACE INTO users (user_id, username, token, config, notifications) VALUES (?, ?, ?, ?, ?)",
-            (
-                user.user_id,
-                user.username,
-                user.token,
-                user.config.model_dump_json(),
-                json.dumps([n.model_dump() for n in user.notifications]),
-            ),
-        )
+        self.insert_or_replace_user(cursor, user)
         self.conn.commit()
 
     def unsubscribe_user(self, user_id: str) -> None:
@@ -75,39 +79,35 @@ class SQLiteManager(DataManager):
         # Perform backup operation as per your requirements
         pass
 
-    def get_users(self) -> list[User]:
+    def get_users(self, where: Optional[Callable[[User], bool]] = None) -> list[User]:
         cursor = self.conn.cursor()
         cursor.execute(
-            "SELECT user_id, username, token, config, notifications FROM users"
+            "SELECT user_id, username, token, config, notifications, state FROM users"
         )
-        rows = cursor.fetchall()
         users = []
-        for row in rows:
-            user = User(
-                user_id=row[0],
-                username=row[1],
-                token=row[2],
-                config=json.loads(row[3]),
-                notifications=json.loads(row[4]),
-            )
-            users.append(user)
+        for user_id, username, token, config, notifications, state in cursor.fetchall():
+            try:
+                user = self.user_from_row(user_id, username, token, config, "[]", state)
+            except crypto.DecryptionError as e:
+                # one unreadable token mustn't stop everyone else being polled
+                logger.error("Skipping user %s: %s", user_id, e)
+                continue
+            if where is None or where(user):
+                user.notifications = codec.notifications_from_list(
+                    codec.loads(notifications)
+                )
+                users.append(user)
         return users
 
     def get(self, user_id: str) -> Optional[User]:
         cursor = self.conn.cursor()
         cursor.execute(
-            "SELECT username, token, config, notifications FROM users WHERE user_id = ?",
+            "SELECT username, token, config, notifications, state FROM users WHERE user_id = ?",
             (user_id,),
         )
         row = cursor.fetchone()
         if row:
-            return User(
-                user_id=user_id,
-                username=row[0],
-                token=row[1],
-                config=json.loads(row[2]),
-                notifications=json.loads(row[3]),
-            )
+            return self.user_from_row(user_id, *row)
         return None
 
     def save(self, user: User) -> None:
@@ -123,19 +123,105 @@ class SQLiteManager(DataManager):
 
     def save_all(self, users: list[User]) -> None:
         cursor = self.conn.cursor()
-        for user in users:
-            self.insert_or_replace_user(cursor, user)
+        cursor.executemany(REPLACE_USER, [self.user_to_row(user) for user in users])
+        self.conn.commit()
+
+    def save_poll_results(self, users: list[User]) -> None:
+        cursor = self.conn.cursor()
+        cursor.executemany(
+            "UPDATE users SET notifications = ?, state = ? WHERE user_id = ?",
+            [
+                (
+                    codec.dumps(
+                        [codec.notification_to_dict(n) for n in user.notifications]
+                    ),
+                    codec.dumps(codec.state_to_dict(user.state)),
+                    user.user_id,
+                )
+                for user in users
+            ],
+        )
+        self.conn.commit()
+
+    def save_config(self, user_id: str, config: Config) -> None:
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "UPDATE users SET config = ? WHERE user_id = ?",
+            (codec.dumps(codec.config_to_dict(config)), user_id),
+        )
         self.conn.commit()
 
     @staticmethod
-    def insert_or_replace_user(cursor, user):
+    def user_to_row(user: User) -> tuple:
+        return (
+            user.user_id,
+            user.username,
+            crypto.encrypt_token(user.token),
+            codec.dumps(codec.config_to_dict(user.config)),
+            codec.dumps([codec.notification_to_dict(n) for n in user.notifications]),
+            codec.dumps(codec.state_to_dict(user.state)),
+        )
+
+    @staticmethod
+    def user_from_row(
+        user_id, username, token, config, notifications, state=None
+    ) -> User:
+        return codec.user_from_parts(
+            user_id,
+            username,
+            token,
+            codec.loads(config),
+            codec.loads(notifications),
+            codec.loads(state) if state is not None else None,
+        )
+
+    @classmethod
+    def insert_or_replace_user(cls, cursor, user):
+        cursor.execute(REPLACE_USER, cls.user_to_row(user))
+
+    def rotate_tokens(self, rotate: Callable[[str], str]) -> int:
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT user_id, token FROM users")
+        rows = [(rotate(token), user_id, token) for user_id, token in cursor.fetchall()]
+        # only if the token is still the one we read: a user who subscribed again
+        # meanwhile keeps the new token (already wrapped by the newest key)
+        cursor.executemany(
+            "UPDATE users SET token = ? WHERE user_id = ? AND token = ?", rows
+        )
+        self.conn.commit()
+        return cursor.rowcount
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        cursor = self.conn.cursor()
+        # The upsert only touches the row if we already own it or it has expired,
+        # so concurrent workers (even in other processes) can't both win it.
+        cursor.execute(
+            """
+            INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET
+                owner = excluded.owner,
+                expires_at = excluded.expires_at
+            WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+            """,
+            (name, owner, now + ttl, now),
+        )
+        self.conn.commit()
+        return cursor.rowcount == 1
+
+    def release_lease(self, name: str, owner: str) -> None:
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "DELETE FROM leases WHERE name = ? AND owner = ?",
+            (name, owner),
+        )
+        self.conn.commit()
+
+    def get_leases(self, prefix: str) -> dict[str, str]:
+        cursor = self.conn.cursor()
         cursor.execute(
-            "REPLACE INTO users (user_id, username, token, config, notifications) VALUES (?, ?, ?, ?, ?)",
-            (
-                user.user_id,
-                user.username,
-                user.token,
-                user.config.model_dump_json(),
-                json.dumps([n.model_dump() for n in user.notifications], default=str),
-            ),
+            "SELECT name, owner FROM leases WHERE expires_at >= ?", (time.time(),)
         )
+        return {
+            name: owner for name, owner in cursor.fetchall() if name.startswith(prefix)
+        }
@@ -1,13 +1,111 @@
+import re
+from datetime import datetime, timezone
 from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, field_validator
 
 from notifications.models import Notification
+from notifications.schedule import parse_quiet_hours
+
+# kept with the config (the web app owns it) but set by actions, not by `/gh/config`
+INTERNAL_CONFIG_FIELDS = frozenset({"ignore_before"})
 
 
 class Config(BaseModel):
     model_config = ConfigDict(extra="forbid")
     frequency: Optional[int] = None
+    # filter rules, applied before any comments are fetched (see notifications.filters);
+    # repos are full names and may use shell-style wildcards, e.g. "octocat/*"
+    include_repos: list[str] = []
+    exclude_repos: list[str] = []
+    # e.g. review_requested, mention; empty means every reason
+    reasons: list[str] = []
+    # regular expressions, matched case-insensitively anywhere in the title
+    include_titles: list[str] = []
+    exclude_titles: list[str] = []
+    # threads with no activity since this time are dropped; set by "Mark all read"
+    ignore_before: Optional[datetime] = None
+    # "HH:MM-HH:MM" in `timezone`, e.g. 22:00-07:00: no polling in this window, and
+    # whatever changed meanwhile is sent as one digest when it ends
+    quiet_hours: Optional[str] = None
+    timezone: str = "UTC"
+    # send each cycle's changes as one message rather than one per thread
+    digest: bool = False
+
+    @field_validator("include_repos", "exclude_repos", "reasons", mode="before")
+    @classmethod
+    def split_comma_separated(cls, value):
+        """Lists arrive from `/gh/config` as e.g. `org/a,org/b`; `none` clears them"""
+        if isinstance(value, str):
+            if value.lower() == "none":
+                return []
+            value = [value]
+        if isinstance(value, list):
+            # repo names and reasons can't contain commas
+            return [
+                v.strip() for item in value for v in str(item).split(",") if v.strip()
+            ]
+        return value
+
+    @field_validator("include_titles", "exclude_titles", mode="before")
+    @classmethod
+    def single_pattern(cls, value):
+        """
+        Patterns are taken whole, as a regex may contain any separator: repeat the
+        key to give several, e.g. `include_titles "v\\d{1,3}" include_titles hotfix`.
+        `none` clears them.
+        """
+        if isinstance(value, str):
+            return [] if value.lower() == "none" else [value]
+        return value
+
+    @field_validator("include_titles", "exclude_titles")
+    @classmethod
+    def check_patterns(cls, patterns: list[str]) -> list[str]:
+        for pattern in patterns:
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"invalid pattern {pattern!r}: {e}")
+        return patterns
+
+    @field_validator("ignore_before")
+    @classmethod
+    def assume_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        if value is not None and value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value
+
+    @field_validator("quiet_hours", mode="before")
+    @classmethod
+    def check_quiet_hours(cls, value):
+        if value is None or (isinstance(value, str) and value.lower() == "none"):
+            return None
+        start, end = parse_quiet_hours(value)
+        return f"{start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d}"
+
+    @field_validator("timezone")
+    @classmethod
+    def check_timezone(cls, value: str) -> str:
+        try:
+            ZoneInfo(value)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"unknown timezone {value!r}, e.g. Europe/London")
+        return value
+
+
+class PollState(BaseModel):
+    """Polling health, kept by the poller (see notifications.schedule)"""
+
+    # consecutive failed polls, reset by a successful one
+    failures: int = 0
+    # not polled again before this time
+    retry_at: Optional[datetime] = None
+    # GitHub rejected the token; polling stops until the user subscribes again
+    token_revoked: bool = False
+    # quiet hours began since the last successful poll, so the next one sends a digest
+    digest_pending: bool = False
 
 
 class User(BaseModel):
@@ -16,3 +114,4 @@ class User(BaseModel):
     token: str
     config: Config = Config()
     notifications: list[Notification] = []
+    state: PollState = PollState()
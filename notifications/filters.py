@@ -0,0 +1,90 @@
+"""
+Per-user notification filters.
+
+They run on the slim `/notifications` payload (see `slim_notification`), so a
+thread that's filtered out costs no comment request and no Slack post. Rules
+are compiled once per distinct configuration and shared between cycles.
+"""
+
+import fnmatch
+import re
+from datetime import timezone
+from functools import lru_cache
+from typing import Optional
+
+from data.user import Config
+
+GITHUB_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def _repos_regex(patterns: tuple[str, ...]) -> Optional[re.Pattern]:
+    if not patterns:
+        return None
+    # GitHub owner and repo names are case-insensitive
+    return re.compile("|".join(fnmatch.translate(p) for p in patterns), re.IGNORECASE)
+
+
+def _titles_regex(patterns: tuple[str, ...]) -> Optional[re.Pattern]:
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE)
+
+
+class NotificationFilter:
+    """Callable returning whether a notification should be kept"""
+
+    def __init__(
+        self,
+        include_repos: tuple[str, ...] = (),
+        exclude_repos: tuple[str, ...] = (),
+        reasons: tuple[str, ...] = (),
+        include_titles: tuple[str, ...] = (),
+        exclude_titles: tuple[str, ...] = (),
+        ignore_before: Optional[str] = None,
+    ):
+        self.include_repos = _repos_regex(include_repos)
+        self.exclude_repos = _repos_regex(exclude_repos)
+        self.reasons = frozenset(reasons) or None
+        self.include_titles = _titles_regex(include_titles)
+        self.exclude_titles = _titles_regex(exclude_titles)
+        # same format as GitHub's `updated_at`, so the two compare as strings
+        self.ignore_before = ignore_before
+
+    def __call__(self, n: dict) -> bool:
+        if self.ignore_before is not None and n["updated_at"] <= self.ignore_before:
+            return False
+        if self.reasons is not None and n["reason"] not in self.reasons:
+            return False
+        repo = n["repository"]["full_name"]
+        if self.include_repos is not None and not self.include_repos.match(repo):
+            return False
+        if self.exclude_repos is not None and self.exclude_repos.match(repo):
+            return False
+        title = n["subject"]["title"]
+        if self.include_titles is not None and not self.include_titles.search(title):
+            return False
+        if self.exclude_titles is not None and self.exclude_titles.search(title):
+            return False
+        return True
+
+
+@lru_cache(maxsize=1024)
+def _compile(*key) -> NotificationFilter:
+    return NotificationFilter(*key)
+
+
+def compile_filter(config: Config) -> NotificationFilter:
+    """The filter for a user's config, compiled on first use"""
+    ignore_before = None
+    if config.ignore_before is not None:
+        ignore_before = config.ignore_before.astimezone(timezone.utc).strftime(
+            GITHUB_TIME_FORMAT
+        )
+    return _compile(
+        tuple(config.include_repos),
+        tuple(config.exclude_repos),
+        tuple(config.reasons),
+        tuple(config.include_titles),
+        tuple(config.exclude_titles),
+        ignore_before,
+    )
@@ -1,15 +1,30 @@
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import Optional
+from typing import Callable, Optional
 
 import requests
 from requests import Response
 
+from data import codec
 from data.user import User
+from notifications.filters import GITHUB_TIME_FORMAT, compile_filter
+from notifications.metrics import (
+    COMMENT_FETCHES,
+    ERRORS,
+    GITHUB_NOT_MODIFIED,
+    GITHUB_REQUEST_SECONDS,
+    NOTIFICATIONS_FILTERED,
+    observe_rate_limit,
+)
 from notifications.models import Notification, Comment
+from notifications.tracing import span
 
-NOTIFICATIONS_URL = "https://api.github.com/notifications"
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com")
+NOTIFICATIONS_URL = f"{GITHUB_API_URL}/notifications"
 CALLBACK_URL = os.environ.get("SLACK_CALLBACK_URL")
+# parallel requests per bulk action
+BULK_CONCURRENCY = 8
 
 
 def get_headers(token: str) -> dict:
@@ -20,11 +35,30 @@ def get_headers(token: str) -> dict:
     }
 
 
+def github_request(
+    method: str, url: str, token: str, endpoint: str, **kwargs
+) -> Response:
+    """Make a GitHub API request, recording latency and rate-limit metrics by endpoint"""
+    try:
+        with GITHUB_REQUEST_SECONDS.labels(endpoint=endpoint).time():
+            response = requests.request(
+                method, url, headers=get_headers(token), **kwargs
+            )
+    except requests.RequestException:
+        ERRORS.labels(stage=f"github_{endpoint}").inc()
+        raise
+    remaining = response.headers.get("X-RateLimit-Remaining")
+    if remaining is not None:
+        observe_rate_limit(int(remaining))
+    if response.status_code == 304:
+        GITHUB_NOT_MODIFIED.labels(endpoint=endpoint).inc()
+    elif not response.ok:
+        ERRORS.labels(stage=f"github_{endpoint}").inc()
+    return response
+
+
 def get_notifications(token: str) -> Response:
-    return requests.get(
-        NOTIFICATIONS_URL,
-        headers=get_headers(token),
-    )
+    return github_request("GET", NOTIFICATIONS_URL, token, "notifications")
 
 
 def check_token(token: str) -> bool:
@@ -35,11 +69,32 @@ class AuthenticationError(Exception):
     pass
 
 
-def get_notifications_json(token: str) -> dict:
+def slim_notification(n: dict) -> dict:
+    """The parts of a notification we use; the rest (mostly `repository`) is dropped"""
+    subject = n["subject"]
+    return {
+        "id": n["id"],
+        "subject": {
+            "title": subject["title"],
+            "url": subject["url"],
+            "latest_comment_url": subject.get("latest_comment_url"),
+        },
+        "reason": n["reason"],
+        "unread": n.get("unread"),
+        "updated_at": n["updated_at"],
+        "url": n["url"],
+        "repository": {"full_name": n["repository"]["full_name"]},
+    }
+
+
+def get_notifications_json(token: str) -> list[dict]:
     response = get_notifications(token)
     if response.status_code == 401:
         raise AuthenticationError("Please refresh token")
-    return response.json()
+    response.raise_for_status()
+    # orjson decodes the page faster than response.json(), and the slim copies
+    # let the full payload be freed as soon as this returns
+    return [slim_notification(n) for n in codec.loads(response.content)]
 
 
 def build_notification_from_json(n: dict, token: str, user_id: str) -> Notification:
@@ -59,16 +114,14 @@ def build_notification_from_json(n: dict, token: str, user_id: str) -> Notificat
         reason=n["reason"],
         url=manual_url,
         latest_comment=latest_comment,
-        updated_at=datetime.strptime(n["updated_at"], "%Y-%m-%dT%H:%M:%SZ"),
+        updated_at=datetime.strptime(n["updated_at"], GITHUB_TIME_FORMAT),
         thread_url=n["url"],
     )
 
 
 def get_latest_comment(latest_comment_url, token) -> Optional[Comment]:
-    latest_url_response = requests.get(
-        latest_comment_url,
-        headers=get_headers(token),
-    )
+    COMMENT_FETCHES.inc()
+    latest_url_response = github_request("GET", latest_comment_url, token, "comment")
     if latest_url_response.status_code != 200:
         return None
     else:
@@ -83,11 +136,14 @@ def get_latest_comment(latest_comment_url, token) -> Optional[Comment]:
 
 
 def get_all_user_notifications(user: User) -> list[Notification]:
-
-    notifications = get_notifications_json(user.token)
-    return [
-        build_notification_from_json(n, user.token, user.user_id) for n in notifications
-    ]
+    with span("fetch"):
+        notifications = get_notifications_json(user.token)
+        keep = compile_filter(user.config)
+        kept = [n for n in notifications if keep(n)]
+        NOTIFICATIONS_FILTERED.inc(len(notifications) - len(kept))
+    # includes fetching each thread's latest comment
+    with span("build"):
+        return [build_notification_from_json(n, user.token, user.user_id) for n in kept]
 
 
 def get_unread_user_notifications(token: str) -> list[Notification]:
@@ -98,18 +154,65 @@ def get_unread_user_notifications(token: str) -> list[Notification]:
 def unsubscribe_thread(token: str, thread_url: str) -> bool:
     # For ignoring a subscription to have any effect, we must first mark the thread as 'read'
     # with a patch request to the thread endpoint
-    request_read = requests.patch(thread_url, headers=get_headers(token))
+    request_read = github_request("PATCH", thread_url, token, "thread")
     if not request_read.ok:
         return False
     subscription_url = thread_url + "/subscription"
-    request_unsub = requests.put(
-        subscription_url, headers=get_headers(token), json={"ignored": True}
+    request_unsub = github_request(
+        "PUT", subscription_url, token, "subscription", json={"ignored": True}
     )
     if not request_unsub.ok:
         return False
     return True
 
 
+def unsubscribe_threads(
+    token: str,
+    thread_urls: list[str],
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> int:
+    """
+    Unsubscribe from many threads concurrently, calling `on_progress(done, total)`
+    as each one finishes. Returns how many succeeded.
+    """
+    succeeded = 0
+    with ThreadPoolExecutor(max_workers=BULK_CONCURRENCY) as pool:
+        futures = [pool.submit(unsubscribe_thread, token, url) for url in thread_urls]
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                succeeded += future.result()
+            except requests.RequestException:
+                pass
+            if on_progress is not None:
+                on_progress(done, len(futures))
+    return succeeded
+
+
+def get_repo_thread_urls(token: str, repo: str) -> list[str]:
+    """Every thread in `repo` the user has notifications for, read ones included"""
+    thread_urls = []
+    url = f"{GITHUB_API_URL}/repos/{repo}/notifications"
+    params = {"all": "true", "per_page": 50}
+    while url:
+        response = github_request(
+            "GET", url, token, "repo_notifications", params=params
+        )
+        if response.status_code == 401:
+            raise AuthenticationError("Please refresh token")
+        response.raise_for_status()
+        thread_urls.extend(n["url"] for n in codec.loads(response.content))
+        # the next page's URL already carries the query parameters
+        url = response.links.get("next", {}).get("url")
+        params = None
+    return thread_urls
+
+
+def mark_all_read(token: str) -> bool:
+    return github_request(
+        "PUT", NOTIFICATIONS_URL, token, "mark_read", json={"read": True}
+    ).ok
+
+
 if __name__ == "__main__":
     print(
         get_all_user_notifications(
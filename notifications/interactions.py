@@ -1,19 +1,27 @@
 import json
-import os
-from enum import Enum
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import cache
 
 from flask import Response, request
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
 
-from app import data_manager
-from notifications.github_funcs import unsubscribe_thread
+from data import get_data_manager
+from data.user import User
+from notifications.github_funcs import (
+    get_repo_thread_urls,
+    mark_all_read,
+    unsubscribe_thread,
+    unsubscribe_threads,
+)
+from notifications.models import Interactions
+from notifications.slack_client import get_client
 
-client = WebClient(token=os.environ.get("SLACK_BOT_TOKEN"))
+logger = logging.getLogger(__name__)
 
-
-class Interactions(Enum):
-    UNSUBSCRIBE_THREAD = "unsubscribe_from_thread"
+# minimum seconds between edits of a bulk action's progress message
+PROGRESS_UPDATE_INTERVAL = 2.0
 
 
 def get_event_payload() -> dict:
@@ -24,28 +32,49 @@ def get_event_payload() -> dict:
 def parse_args_from_callback_id(callback_id) -> tuple[str, tuple[str, ...]]:
     parts = callback_id.split("::")
     callback_id = parts[0]
-    args = tuple(parts[1].split("__"))
+    # the last argument may be a repo name, which can itself contain "__"
+    args = tuple(parts[1].split("__", 1))
     return callback_id, args
 
 
+def remove_button(blocks: list[dict], block_id: str, action_id: str) -> list[dict]:
+    """`blocks` without one button, and without its actions block if that was the last"""
+    remaining = []
+    for block in blocks:
+        if block.get("block_id") == block_id:
+            elements = [
+                e for e in block.get("elements", []) if e.get("action_id") != action_id
+            ]
+            if not elements:
+                continue
+            block = {**block, "elements": elements}
+        remaining.append(block)
+    return remaining
+
+
 def unsubscribe_thread_callback(user_id, thread_url, payload: dict):
     message = payload.get("message", {})
     message_ts = message.get("ts")
     channel_id = payload.get("channel", {}).get("id")
-    user = data_manager.get(user_id)
+    user = get_data_manager().get(user_id)
     if user is None:
         return Response("User not subscribed", status=404)
 
     if not unsubscribe_thread(user.token, thread_url):
         return Response("Something went wrong", status=400)
 
-    # remove the actions block at the bottom of the message (removes the Unsubscribe button)
-    existing_blocks = message.get("blocks")
-    existing_blocks.pop()
+    # remove the Unsubscribe button, keeping the repo and "Mark all read" ones
+    action = payload["actions"][0]
+    existing_blocks = remove_button(
+        message.get("blocks", []), action.get("block_id"), action.get("action_id")
+    )
+    client = get_client()
     response = client.chat_update(
         channel=channel_id, ts=message_ts, blocks=existing_blocks
     )
     if response["ok"]:
+        from slack_sdk.errors import SlackApiError
+
         try:
             # add an emoji reaction to the message
             client.reactions_add(
@@ -57,4 +86,115 @@ def unsubscribe_thread_callback(user_id, thread_url, payload: dict):
     return Response("Unsubscribed!", status=200)
 
 
-EVENT_CALLBACKS = {Interactions.UNSUBSCRIBE_THREAD.value: unsubscribe_thread_callback}
+@cache
+def get_bulk_executor() -> ThreadPoolExecutor:
+    """
+    Bulk actions run here: Slack expects an interaction to be acknowledged within
+    3 seconds, and unsubscribing from a whole repo can take much longer.
+    """
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="bulk-action")
+
+
+class ProgressMessage:
+    """A DM that is edited as a bulk action progresses, at most every few seconds"""
+
+    def __init__(self, user_id: str, text: str):
+        self.client = get_client()
+        response = self.client.chat_postMessage(channel=user_id, text=text)
+        self.channel = response["channel"]
+        self.ts = response["ts"]
+        self.last_update = time.monotonic()
+
+    def update(self, text: str, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self.last_update < PROGRESS_UPDATE_INTERVAL:
+            return
+        self.last_update = now
+        self.client.chat_update(channel=self.channel, ts=self.ts, text=text)
+
+
+def _run_in_background(fn, *args) -> Response:
+    def run():
+        try:
+            fn(*args)
+        except Exception:
+            logger.exception("bulk action %s failed", fn.__name__)
+
+    get_bulk_executor().submit(run)
+    return Response("Working on it", status=200)
+
+
+def _mute(user: User, repo: str):
+    if repo not in user.config.exclude_repos:
+        user.config.exclude_repos.append(repo)
+        get_data_manager().save_config(user.user_id, user.config)
+
+
+def mute_repo_callback(user_id, repo, payload: dict):
+    """Stop notifying about a repo, without touching the GitHub subscriptions"""
+    user = get_data_manager().get(user_id)
+    if user is None:
+        return Response("User not subscribed", status=404)
+    # the next poll drops the repo's stored threads along with the fetched ones
+    _mute(user, repo)
+    get_client().chat_postMessage(
+        channel=user_id,
+        text=f"Muted {repo}, its threads won't be sent to you any more.",
+    )
+    return Response("Muted!", status=200)
+
+
+def _unsubscribe_repo(user_id: str, repo: str):
+    user = get_data_manager().get(user_id)
+    if user is None:
+        return
+    # muted first, so polls during the (possibly long) unsubscribing skip the repo
+    _mute(user, repo)
+    thread_urls = set(get_repo_thread_urls(user.token, repo))
+    thread_urls.update(n.thread_url for n in user.notifications if n.repo == repo)
+    progress = ProgressMessage(
+        user_id, f"Unsubscribing from {len(thread_urls)} threads in {repo}…"
+    )
+    succeeded = unsubscribe_threads(
+        user.token,
+        sorted(thread_urls),
+        on_progress=lambda done, total: progress.update(
+            f"Unsubscribing from threads in {repo}… {done}/{total}"
+        ),
+    )
+    progress.update(
+        f"Unsubscribed from {succeeded}/{len(thread_urls)} threads in {repo} "
+        f"and muted it.",
+        force=True,
+    )
+
+
+def unsubscribe_repo_callback(user_id, repo, payload: dict):
+    return _run_in_background(_unsubscribe_repo, user_id, repo)
+
+
+def _mark_all_read(user_id: str):
+    data_manager = get_data_manager()
+    user = data_manager.get(user_id)
+    if user is None:
+        return
+    progress = ProgressMessage(user_id, "Marking all notifications as read…")
+    marked_at = datetime.now(timezone.utc)
+    if not mark_all_read(user.token):
+        progress.update("Couldn't mark notifications as read.", force=True)
+        return
+    user.config.ignore_before = marked_at
+    data_manager.save_config(user_id, user.config)
+    progress.update("Marked all notifications as read.", force=True)
+
+
+def mark_all_read_callback(user_id, payload: dict):
+    return _run_in_background(_mark_all_read, user_id)
+
+
+EVENT_CALLBACKS = {
+    Interactions.UNSUBSCRIBE_THREAD.value: unsubscribe_thread_callback,
+    Interactions.MUTE_REPO.value: mute_repo_callback,
+    Interactions.UNSUBSCRIBE_REPO.value: unsubscribe_repo_callback,
+    Interactions.MARK_ALL_READ.value: mark_all_read_callback,
+}
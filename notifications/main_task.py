@@ -1,29 +1,58 @@
-from typing import Callable, Optional
-
-from apscheduler.triggers.cron import CronTrigger
+import logging
+from datetime import datetime, timezone
+from functools import cache
+from typing import TYPE_CHECKING, Callable, Optional
 
 from data.base import DataManager
 from data.json_manager import JsonManager
 from data.user import User
-from notifications.github_funcs import get_all_user_notifications
+from notifications.github_funcs import AuthenticationError, get_all_user_notifications
+from notifications.metrics import (
+    DATA_MANAGER_SECONDS,
+    ERRORS,
+    POLL_TIER_SECONDS,
+    POLL_USER_SECONDS,
+    rate_limit_cycle,
+)
 from notifications.models import Notification
-from notifications.notify_slack import notify_slack
-from apscheduler.schedulers.background import BackgroundScheduler
+from notifications.notify_slack import (
+    notify_slack,
+    notify_slack_digest,
+    notify_token_revoked,
+)
+from notifications.schedule import (
+    is_due,
+    is_quiet,
+    record_failure,
+    record_success,
+)
+from notifications.tracing import set_field, span, trace_cycle
 
+if TYPE_CHECKING:
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.schedulers.base import BaseScheduler
 
-scheduler = BackgroundScheduler()
+logger = logging.getLogger(__name__)
 
 NotifyFunc = (
     Callable[[User, Notification], None] | Callable[[User, Notification, bool], None]
 )
+DigestFunc = Callable[[User, list[tuple[Notification, bool]]], None]
+UserFilter = Callable[[User], bool]
 
 
-def main(
-    users: list[User],
+def poll_user(
+    user: User,
     notify_fn: NotifyFunc,
+    digest_fn: Optional[DigestFunc] = None,
+    wants_digest: Optional[UserFilter] = None,
 ):
-    for user in users:
-        latest_notifications = get_all_user_notifications(user)
+    """
+    Diff the user's notifications against the stored ones and send the changes,
+    as a single `digest_fn` message if `wants_digest` selects the user.
+    """
+    latest_notifications = get_all_user_notifications(user)
+    with span("diff"):
         notifications = dict(((n.id, n) for n in latest_notifications))
         user_notifications = dict(((n.id, n) for n in user.notifications))
         all_notification_ids = sorted(
@@ -36,99 +65,219 @@ def main(
             (notifications.get(_id), user_notifications.get(_id))
             for _id in all_notification_ids
         ]
-        for new, old in id_pairs:
-            if old is None:
-                notify_fn(user, new)
-            elif new is None:
+        changes = [
+            (new, old is not None)
+            for new, old in id_pairs
+            if new is not None and (old is None or new != old)
+        ]
+    if (
+        len(changes) > 1
+        and digest_fn is not None
+        and wants_digest is not None
+        and wants_digest(user)
+    ):
+        with span("notify"):
+            digest_fn(user, changes)
+    else:
+        for new, updated in changes:
+            try:
+                with span("notify"):
+                    if updated:
+                        notify_fn(user, new, True)
+                    else:
+                        notify_fn(user, new)
+            except Exception:
+                # store what was delivered so far, so a retry doesn't send it again
+                user.notifications = list(user_notifications.values())
+                raise
+            user_notifications[new.id] = new
+    user.notifications = latest_notifications
+
+
+def main(
+    users: list[User],
+    notify_fn: NotifyFunc,
+    tier: str = "all",
+    digest_fn: Optional[DigestFunc] = None,
+    wants_digest: Optional[UserFilter] = None,
+    revoked_fn: Optional[Callable[[User], None]] = None,
+):
+    """
+    Poll each user in turn. A failure only affects that user: it is recorded in
+    their `state` for backoff, and a rejected token is reported once through
+    `revoked_fn`.
+    """
+    user_seconds = POLL_USER_SECONDS.labels(tier=tier)
+    for user in users:
+        with user_seconds.time():
+            try:
+                poll_user(user, notify_fn, digest_fn, wants_digest)
+            except AuthenticationError:
+                ERRORS.labels(stage="token_revoked").inc()
+                logger.warning("GitHub rejected the token of %s", user.user_id)
+                user.state.token_revoked = True
+                if revoked_fn is not None:
+                    try:
+                        revoked_fn(user)
+                    except Exception:
+                        logger.exception("could not tell %s", user.user_id)
+                continue
+            except Exception:
+                ERRORS.labels(stage="poll_user").inc()
+                record_failure(user.state, datetime.now(timezone.utc))
+                logger.exception(
+                    "polling %s failed %d times in a row, retrying after %s",
+                    user.user_id,
+                    user.state.failures,
+                    user.state.retry_at,
+                )
                 continue
-            elif new != old:
-                notify_fn(user, new, True)
-        user.notifications = latest_notifications
-
-
-def notify_all_users_by_slack(data_manager: DataManager):
-    users = data_manager.get_users()
-    main(users, notify_slack)
-    data_manager.save_all(users)
-
-
-def notify_users_with_30m_config_by_slack(data_manager: DataManager):
-    users = [
-        u
-        for u in data_manager.get_users()
-        if u.config.frequency is not None and 22.5 <= u.config.frequency
-    ]
-    main(users, notify_slack)
-    data_manager.save_all(users)
-
-
-def notify_users_with_15m_config_by_slack(data_manager: DataManager):
-    users = [
-        u
-        for u in data_manager.get_users()
-        if u.config.frequency is None or 12.5 <= u.config.frequency < 22.5
-    ]
-    main(users, notify_slack)
-    data_manager.save_all(users)
-
-
-def notify_users_with_10m_config_by_slack(data_manager: DataManager):
-    users = [
-        u
-        for u in data_manager.get_users()
-        if u.config.frequency is not None and 7.5 <= u.config.frequency < 12.5
-    ]
-    main(users, notify_slack)
-    data_manager.save_all(users)
-
-
-def notify_users_with_5m_config_by_slack(data_manager: DataManager):
-    users = [
-        u
-        for u in data_manager.get_users()
-        if u.config.frequency is not None and 2.5 <= u.config.frequency < 7.5
-    ]
-    main(users, notify_slack)
-    data_manager.save_all(users)
-
-
-def notify_users_with_1m_config_by_slack(data_manager: DataManager):
-    users = [
-        u
-        for u in data_manager.get_users()
-        if u.config.frequency is not None and 0 < u.config.frequency < 2.5
-    ]
-    main(users, notify_slack)
-    data_manager.save_all(users)
+        record_success(user.state)
 
 
-def start_scheduler(data_manager: DataManager):
+def notify_users_by_slack(
+    data_manager: DataManager,
+    tier: str,
+    in_tier: Callable[[Optional[int]], bool],
+    owns: Optional[UserFilter] = None,
+):
+    """
+    Run a cycle for users whose frequency falls in the tier (and, when sharded,
+    this worker's shard), skipping those in their quiet hours or backing off
+    """
+    now = datetime.now(timezone.utc)
+
+    def selected(u: User) -> bool:
+        if not in_tier(u.config.frequency) or (owns is not None and not owns(u)):
+            return False
+        if is_quiet(u.config, now):
+            # loaded once per quiet window, to note that a digest is owed after it
+            return not u.state.digest_pending
+        return is_due(u.state, now)
+
+    with (
+        POLL_TIER_SECONDS.labels(tier=tier).time(),
+        rate_limit_cycle(tier),
+        trace_cycle(tier),
+    ):
+        with span("load_users"):
+            with DATA_MANAGER_SECONDS.labels(operation="get_users").time():
+                users = data_manager.get_users(selected)
+        polled = []
+        for user in users:
+            if is_quiet(user.config, now):
+                user.state.digest_pending = True
+            else:
+                polled.append(user)
+        set_field("users", len(polled))
+        main(
+            polled,
+            notify_slack,
+            tier,
+            digest_fn=notify_slack_digest,
+            wants_digest=lambda u: u.config.digest or u.state.digest_pending,
+            revoked_fn=notify_token_revoked,
+        )
+        with span("save"):
+            # only notifications and state, so config changes made from Slack
+            # during the cycle aren't overwritten
+            with DATA_MANAGER_SECONDS.labels(operation="save_poll_results").time():
+                data_manager.save_poll_results(users)
+
+
+def notify_all_users_by_slack(
+    data_manager: DataManager, owns: Optional[UserFilter] = None
+):
+    notify_users_by_slack(data_manager, "all", lambda f: True, owns)
+
+
+def notify_users_with_30m_config_by_slack(
+    data_manager: DataManager, owns: Optional[UserFilter] = None
+):
+    notify_users_by_slack(
+        data_manager, "30m", lambda f: f is not None and 22.5 <= f, owns
+    )
+
+
+def notify_users_with_15m_config_by_slack(
+    data_manager: DataManager, owns: Optional[UserFilter] = None
+):
+    notify_users_by_slack(
+        data_manager, "15m", lambda f: f is None or 12.5 <= f < 22.5, owns
+    )
+
+
+def notify_users_with_10m_config_by_slack(
+    data_manager: DataManager, owns: Optional[UserFilter] = None
+):
+    notify_users_by_slack(
+        data_manager, "10m", lambda f: f is not None and 7.5 <= f < 12.5, owns
+    )
+
+
+def notify_users_with_5m_config_by_slack(
+    data_manager: DataManager, owns: Optional[UserFilter] = None
+):
+    notify_users_by_slack(
+        data_manager, "5m", lambda f: f is not None and 2.5 <= f < 7.5, owns
+    )
+
+
+def notify_users_with_1m_config_by_slack(
+    data_manager: DataManager, owns: Optional[UserFilter] = None
+):
+    notify_users_by_slack(
+        data_manager, "1m", lambda f: f is not None and 0 < f < 2.5, owns
+    )
+
+
+@cache
+def get_scheduler() -> "BackgroundScheduler":
+    from apscheduler.schedulers.background import BackgroundScheduler
+
+    return BackgroundScheduler()
+
+
+def add_jobs(
+    scheduler: "BaseScheduler",
+    data_manager: DataManager,
+    owns: Optional[UserFilter] = None,
+):
+    from apscheduler.triggers.cron import CronTrigger
+
+    args = (data_manager, owns)
     scheduler.add_job(
         notify_users_with_1m_config_by_slack,
         "interval",
-        args=(data_manager,),
+        args=args,
         minutes=1,
     )
     scheduler.add_job(
         notify_users_with_5m_config_by_slack,
         CronTrigger(minute="0,5,10,15,20,25,30,35,40,45,50,55"),
-        args=(data_manager,),
+        args=args,
     )
     scheduler.add_job(
         notify_users_with_10m_config_by_slack,
         CronTrigger(minute="0,10,20,30,40,50"),
-        args=(data_manager,),
+        args=args,
     )
     scheduler.add_job(
         notify_users_with_15m_config_by_slack,
         CronTrigger(minute="0,15,30,45"),
-        args=(data_manager,),
+        args=args,
     )
     scheduler.add_job(
         notify_users_with_30m_config_by_slack,
         CronTrigger(minute="0,30"),
-        args=(data_manager,),
+        args=args,
     )
+
+
+def start_scheduler(data_manager: DataManager):
+    """Poll every user from a background thread of the current process"""
+    scheduler = get_scheduler()
+    add_jobs(scheduler, data_manager)
     scheduler.start()
 
 
@@ -0,0 +1,193 @@
+"""
+Prometheus metrics, via prometheus_client.
+
+The web app exposes them on `/gh/metrics` and a worker can serve its own on
+METRICS_PORT (see `serve_metrics`). Polling happens in the workers (see
+worker.py), so the tier, GitHub and Slack metrics come from there; the web app
+on its own only has the interaction and auth ones.
+
+When the web app runs with several processes (e.g. gunicorn workers), set
+PROMETHEUS_MULTIPROC_DIR to an empty directory, cleared on every deploy, in its
+environment. Each process then writes its values there and a scrape adds them
+all up, instead of returning whichever process happened to answer. Workers on
+the same host may share the directory (set the same PROMETHEUS_MULTIPROC_DIR
+for them), and `/gh/metrics` then includes their polling metrics too; workers
+elsewhere are scraped on their METRICS_PORT.
+"""
+
+import hmac
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+    300,
+)
+
+
+def render() -> bytes:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_process_dead() -> None:
+    """Drop this process's live gauges from PROMETHEUS_MULTIPROC_DIR, on exit"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def check_metrics_token(authorization: str | None) -> bool:
+    """Scrapers authenticate with `Authorization: Bearer $METRICS_TOKEN`"""
+    expected = os.environ.get("METRICS_TOKEN")
+    if not expected or not authorization:
+        return False
+    return hmac.compare_digest(authorization, f"Bearer {expected}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        if not check_metrics_token(self.headers.get("Authorization")):
+            self.send_error(403)
+            return
+        body = render()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """
+    Serve `/metrics` from a daemon thread, for processes without the Flask app
+    (prometheus_client's start_http_server, plus the METRICS_TOKEN check)
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+POLL_USER_SECONDS = Histogram(
+    "poll_user_cycle_seconds",
+    "Time to fetch, diff and notify a single user",
+    ("tier",),
+    buckets=DEFAULT_BUCKETS,
+)
+POLL_TIER_SECONDS = Histogram(
+    "poll_tier_cycle_seconds",
+    "Time for a whole tier cycle, including loading and saving users",
+    ("tier",),
+    buckets=DEFAULT_BUCKETS,
+)
+GITHUB_REQUEST_SECONDS = Histogram(
+    "github_request_seconds",
+    "GitHub API request latency",
+    ("endpoint",),
+    buckets=DEFAULT_BUCKETS,
+)
+SLACK_POST_SECONDS = Histogram(
+    "slack_post_seconds",
+    "Slack chat.postMessage latency",
+    buckets=DEFAULT_BUCKETS,
+)
+DATA_MANAGER_SECONDS = Histogram(
+    "data_manager_seconds",
+    "DataManager operation latency",
+    ("operation",),
+    buckets=DEFAULT_BUCKETS,
+)
+NOTIFICATIONS_SENT = Counter(
+    "notifications_sent_total",
+    "Notifications posted to Slack",
+    ("kind",),
+)
+NOTIFICATIONS_FILTERED = Counter(
+    "notifications_filtered_total",
+    "Threads dropped by user filter rules before being fetched in full",
+)
+COMMENT_FETCHES = Counter(
+    "github_comment_fetches_total",
+    "Latest-comment requests made to GitHub",
+)
+GITHUB_NOT_MODIFIED = Counter(
+    "github_not_modified_total",
+    "GitHub responses with status 304",
+    ("endpoint",),
+)
+GITHUB_RATE_LIMIT_REMAINING = Gauge(
+    "github_rate_limit_remaining_min",
+    "Lowest X-RateLimit-Remaining of any token in the tier's last cycle",
+    ("tier",),
+    multiprocess_mode="livemin",
+)
+ERRORS = Counter(
+    "errors_total",
+    "Errors by stage",
+    ("stage",),
+)
+
+
+# the lowest rate limit seen by the cycle running in this context, if any
+_lowest_rate_limit: ContextVar[Optional[list[Optional[int]]]] = ContextVar(
+    "lowest_rate_limit", default=None
+)
+
+
+def observe_rate_limit(remaining: int) -> None:
+    lowest = _lowest_rate_limit.get()
+    if lowest is not None and (lowest[0] is None or remaining < lowest[0]):
+        lowest[0] = remaining
+
+
+@contextmanager
+def rate_limit_cycle(tier: str):
+    """
+    Rate limits are per token, so a cycle reports the lowest one it saw: the user
+    closest to running out. Requests outside a cycle aren't counted.
+    """
+    lowest = [None]
+    reset = _lowest_rate_limit.set(lowest)
+    try:
+        yield
+    finally:
+        _lowest_rate_limit.reset(reset)
+        if lowest[0] is not None:
+            GITHUB_RATE_LIMIT_REMAINING.labels(tier=tier).set(lowest[0])
@@ -1,10 +1,18 @@
 from dataclasses import dataclass
 from datetime import datetime
+from enum import Enum
 from typing import Optional
 
 from pydantic import BaseModel
 
 
+class Interactions(Enum):
+    UNSUBSCRIBE_THREAD = "unsubscribe_from_thread"
+    MUTE_REPO = "mute_repo"
+    UNSUBSCRIBE_REPO = "unsubscribe_from_repo"
+    MARK_ALL_READ = "mark_all_read"
+
+
 @dataclass
 class Comment:
     id: int
@@ -1,13 +1,48 @@
-import os
-
-from slack_sdk import WebClient
+import json
+import re
+from functools import lru_cache
+from json.encoder import encode_basestring_ascii
+from typing import Optional
 
 from data.user import User
-from notifications.interactions import Interactions
-from notifications.models import Notification
+from notifications.metrics import ERRORS, NOTIFICATIONS_SENT, SLACK_POST_SECONDS
+from notifications.models import Interactions, Notification
+from notifications.slack_client import get_client
+
+
+SECTION_TEXT_LIMIT = 3000  # Slack rejects section blocks with longer text
+MESSAGE_BLOCK_LIMIT = 50  # ... and messages with more blocks
+
+_PLACEHOLDER = re.compile(r"\\u0000(\w+)\\u0000")
+
+
+def truncate(text: str, limit: int = SECTION_TEXT_LIMIT) -> str:
+    if len(text) <= limit:
+        return text
+    return text[: limit - 1] + "…"
 
 
-def get_blocks(notification: Notification, updated=False):
+def _escape(value: str) -> str:
+    """The body of a JSON string literal, escaped exactly as `json.dumps` would"""
+    return encode_basestring_ascii(value)[1:-1]
+
+
+@lru_cache(maxsize=256)
+def _escaped_reason(reason: str) -> str:
+    return _escape(" ".join(reason.split("_")))
+
+
+def _build_blocks(
+    updated: bool,
+    link_url: str,
+    title: str,
+    reason: str,
+    button_value: str,
+    repo_args: str,
+    user_id: str,
+    author: Optional[str] = None,
+    body: Optional[str] = None,
+) -> list[dict]:
     blocks = [
         {
             "type": "header",
@@ -20,7 +55,7 @@ def get_blocks(notification: Notification, updated=False):
             "type": "section",
             "text": {
                 "type": "mrkdwn",
-                "text": f"*<{notification.latest_comment.html_url if notification.latest_comment else notification.url}|{notification.title}>*",
+                "text": f"*<{link_url}|{title}>*",
             },
         },
         {
@@ -28,22 +63,19 @@ def get_blocks(notification: Notification, updated=False):
             "fields": [
                 {
                     "type": "mrkdwn",
-                    "text": f"*Reason:* {' '.join(notification.reason.split('_'))}",
+                    "text": f"*Reason:* {reason}",
                 }
             ],
         },
     ]
-    if (
-        notification.latest_comment
-        and notification.latest_comment.html_url != notification.url
-    ):
+    if author is not None:
         blocks.append(
             {
                 "type": "section",
                 "fields": [
                     {
                         "type": "mrkdwn",
-                        "text": f"_*@{notification.latest_comment.author}* commented:_",
+                        "text": f"_*@{author}* commented:_",
                     }
                 ],
             },
@@ -53,7 +85,7 @@ def get_blocks(notification: Notification, updated=False):
                 "type": "section",
                 "text": {
                     "type": "mrkdwn",
-                    "text": notification.latest_comment.body,
+                    "text": body,
                 },
             },
         )
@@ -71,22 +103,224 @@ def get_blocks(notification: Notification, updated=False):
                     },
                     # The value string includes a reference to the callback and also the args
                     # to be passed to the callback e.g. `<CALLBACK_ID>::<ARG1>__<ARG2>__<ARG3>__etc..`
-                    "value": f"{Interactions.UNSUBSCRIBE_THREAD.value}::{notification.slack_user_id}__{notification.thread_url}",
+                    "value": button_value,
                     "action_id": "unsubscribe-thread-action",
                 },
+                {
+                    "type": "button",
+                    "text": {
+                        "type": "plain_text",
+                        "text": "Mute repo",
+                        "emoji": True,
+                    },
+                    "value": f"{Interactions.MUTE_REPO.value}::{repo_args}",
+                    "action_id": "mute-repo-action",
+                },
+                {
+                    "type": "button",
+                    "text": {
+                        "type": "plain_text",
+                        "text": "Unsubscribe from repo",
+                        "emoji": True,
+                    },
+                    "value": f"{Interactions.UNSUBSCRIBE_REPO.value}::{repo_args}",
+                    "action_id": "unsubscribe-repo-action",
+                },
+                {
+                    "type": "button",
+                    "text": {
+                        "type": "plain_text",
+                        "text": "Mark all read",
+                        "emoji": True,
+                    },
+                    "value": f"{Interactions.MARK_ALL_READ.value}::{user_id}",
+                    "action_id": "mark-all-read-action",
+                    "confirm": {
+                        "title": {"type": "plain_text", "text": "Mark all read?"},
+                        "text": {
+                            "type": "plain_text",
+                            "text": "This marks every GitHub notification as read.",
+                        },
+                        "confirm": {"type": "plain_text", "text": "Mark all read"},
+                        "deny": {"type": "plain_text", "text": "Cancel"},
+                    },
+                },
             ],
         },
     )
     return blocks
 
 
+def _shows_comment(notification: Notification) -> bool:
+    return bool(
+        notification.latest_comment
+        and notification.latest_comment.html_url != notification.url
+    )
+
+
+def _button_value(notification: Notification) -> str:
+    return f"{Interactions.UNSUBSCRIBE_THREAD.value}::{notification.slack_user_id}__{notification.thread_url}"
+
+
+def _repo_args(notification: Notification) -> str:
+    return f"{notification.slack_user_id}__{notification.repo}"
+
+
+def get_blocks(notification: Notification, updated=False) -> list[dict]:
+    """The message blocks as plain dicts (see `render_blocks` for the send path)"""
+    comment = notification.latest_comment
+    with_comment = _shows_comment(notification)
+    return _build_blocks(
+        updated,
+        link_url=comment.html_url if comment else notification.url,
+        title=notification.title,
+        reason=" ".join(notification.reason.split("_")),
+        button_value=_button_value(notification),
+        repo_args=_repo_args(notification),
+        user_id=notification.slack_user_id,
+        author=comment.author if with_comment else None,
+        body=truncate(comment.body) if with_comment else None,
+    )
+
+
+class BlockTemplate:
+    """
+    Blocks pre-serialised to JSON with `\\x00name\\x00` placeholders cut out, so
+    rendering a message is a single join of static fragments and escaped values.
+    """
+
+    def __init__(self, blocks: list[dict]):
+        parts = _PLACEHOLDER.split(json.dumps(blocks))
+        self.fragments = parts[::2]
+        self.fields = parts[1::2]
+
+    def render(self, values: dict[str, str]) -> str:
+        """`values` must already be escaped for a JSON string"""
+        out = [self.fragments[0]]
+        for field, fragment in zip(self.fields, self.fragments[1:]):
+            out.append(values[field])
+            out.append(fragment)
+        return "".join(out)
+
+
+def _compile_template(updated: bool, with_comment: bool) -> BlockTemplate:
+    names = ["link_url", "title", "reason", "button_value", "repo_args", "user_id"]
+    if with_comment:
+        names += ["author", "body"]
+    return BlockTemplate(_build_blocks(updated, **{n: f"\x00{n}\x00" for n in names}))
+
+
+# keyed by (updated, with_comment)
+TEMPLATES = {
+    (updated, with_comment): _compile_template(updated, with_comment)
+    for updated in (False, True)
+    for with_comment in (False, True)
+}
+
+
+def render_blocks(notification: Notification, updated=False) -> str:
+    """`get_blocks` encoded as JSON, ready to pass straight to `chat_postMessage`"""
+    comment = notification.latest_comment
+    with_comment = _shows_comment(notification)
+    values = {
+        "link_url": _escape(comment.html_url if comment else notification.url),
+        "title": _escape(notification.title),
+        "reason": _escaped_reason(notification.reason),
+        "button_value": _escape(_button_value(notification)),
+        "repo_args": _escape(_repo_args(notification)),
+        "user_id": _escape(notification.slack_user_id),
+    }
+    if with_comment:
+        values["author"] = _escape(comment.author)
+        values["body"] = _escape(truncate(comment.body))
+    return TEMPLATES[(updated, with_comment)].render(values)
+
+
+def _post(kind: str, **kwargs):
+    """chat.postMessage, recording its latency and counting it as sent `kind`"""
+    try:
+        with SLACK_POST_SECONDS.time():
+            get_client().chat_postMessage(**kwargs)
+    except Exception:
+        ERRORS.labels(stage="slack_post").inc()
+        raise
+    NOTIFICATIONS_SENT.labels(kind=kind).inc()
+
+
 def notify_slack(user: User, notification: Notification, updated=False):
-    client = WebClient(token=os.environ.get("SLACK_BOT_TOKEN"))
-    client.chat_postMessage(
+    _post(
+        "updated" if updated else "new",
         channel=user.user_id,
         user=user.user_id,
         mrkdwn=True,
         unfurl_links=False,
-        blocks=get_blocks(notification, updated),
+        blocks=render_blocks(notification, updated),
         text=f"{'Update on' if updated else 'New notification for'} {notification.title}",
     )
+
+
+def get_digest_blocks(changes: list[tuple[Notification, bool]]) -> list[dict]:
+    """One message listing several `(notification, updated)` changes"""
+    shown = changes[: MESSAGE_BLOCK_LIMIT - 2]
+    blocks = [
+        {
+            "type": "header",
+            "text": {
+                "type": "plain_text",
+                "text": f"{len(changes)} notification updates",
+            },
+        },
+    ]
+    for notification, updated in shown:
+        comment = notification.latest_comment
+        link_url = comment.html_url if comment else notification.url
+        reason = " ".join(notification.reason.split("_"))
+        blocks.append(
+            {
+                "type": "section",
+                "text": {
+                    "type": "mrkdwn",
+                    "text": truncate(
+                        f"{'Updated' if updated else 'New'}: *<{link_url}|{notification.title}>*\n"
+                        f"{notification.repo} · {reason}"
+                    ),
+                },
+            }
+        )
+    if len(changes) > len(shown):
+        blocks.append(
+            {
+                "type": "context",
+                "elements": [
+                    {
+                        "type": "mrkdwn",
+                        "text": f"…and {len(changes) - len(shown)} more",
+                    }
+                ],
+            }
+        )
+    return blocks
+
+
+def notify_slack_digest(user: User, changes: list[tuple[Notification, bool]]):
+    _post(
+        "digest",
+        channel=user.user_id,
+        user=user.user_id,
+        mrkdwn=True,
+        unfurl_links=False,
+        blocks=get_digest_blocks(changes),
+        text=f"{len(changes)} GitHub notification updates",
+    )
+
+
+def notify_token_revoked(user: User):
+    _post(
+        "token_revoked",
+        channel=user.user_id,
+        user=user.user_id,
+        text=(
+            "GitHub rejected your token, so your notifications are paused. "
+            "Subscribe again with a new token to resume them; your settings are kept."
+        ),
+    )
@@ -0,0 +1,88 @@
+"""
+Per-user quiet hours and failure backoff.
+
+Users are not polled while their quiet window is open, so no GitHub requests
+are made for them. Their stored notifications aren't touched either, so the
+first poll after the window diffs against the state from before it and picks
+up everything that changed overnight. The first cycle that finds a user quiet
+sets `digest_pending`, and that later poll sends the changes as one digest; the
+flag is only cleared by a successful poll, so a poll that fails or is skipped
+doesn't turn the backlog into one message per thread.
+
+Users whose polls fail are retried after an exponentially growing delay, capped
+at BACKOFF_MAX. A rejected token stops polling altogether until the user
+subscribes again.
+"""
+
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import TYPE_CHECKING
+from zoneinfo import ZoneInfo
+
+if TYPE_CHECKING:
+    from data.user import Config, PollState
+
+BACKOFF_BASE = timedelta(minutes=1)
+BACKOFF_MAX = timedelta(hours=1)
+
+_QUIET_HOURS = re.compile(r"^(\d{1,2}):(\d{2})-(\d{1,2}):(\d{2})$")
+
+
+def parse_quiet_hours(value: str) -> tuple[int, int]:
+    """`"22:00-07:00"` -> start and end as minutes since midnight"""
+    match = _QUIET_HOURS.match(value.strip())
+    if match is None:
+        raise ValueError(f"expected HH:MM-HH:MM, got {value!r}")
+    start_h, start_m, end_h, end_m = map(int, match.groups())
+    if start_h > 23 or end_h > 23 or start_m > 59 or end_m > 59:
+        raise ValueError(f"invalid time in {value!r}")
+    start, end = start_h * 60 + start_m, end_h * 60 + end_m
+    if start == end:
+        raise ValueError("quiet hours must not start and end at the same time")
+    return start, end
+
+
+@lru_cache(maxsize=1024)
+def _window(quiet_hours: str, tz: str) -> tuple[int, int, ZoneInfo]:
+    return *parse_quiet_hours(quiet_hours), ZoneInfo(tz)
+
+
+def _local_minute(now: datetime, tz: ZoneInfo) -> int:
+    local = now.astimezone(tz)
+    return local.hour * 60 + local.minute
+
+
+def _in_window(minute: int, start: int, end: int) -> bool:
+    if start < end:
+        return start <= minute < end
+    # wraps past midnight
+    return minute >= start or minute < end
+
+
+def is_quiet(config: "Config", now: datetime) -> bool:
+    """`now` must be timezone-aware"""
+    if config.quiet_hours is None:
+        return False
+    start, end, tz = _window(config.quiet_hours, config.timezone)
+    return _in_window(_local_minute(now, tz), start, end)
+
+
+def is_due(state: "PollState", now: datetime) -> bool:
+    if state.token_revoked:
+        return False
+    return state.retry_at is None or state.retry_at <= now
+
+
+def record_failure(state: "PollState", now: datetime) -> None:
+    state.failures += 1
+    # the exponent is capped too, as timedelta overflows long before it matters
+    delay = min(BACKOFF_BASE * 2 ** min(state.failures - 1, 16), BACKOFF_MAX)
+    state.retry_at = now + delay
+
+
+def record_success(state: "PollState") -> None:
+    """After a poll that completed, including sending any digest that was due"""
+    state.failures = 0
+    state.retry_at = None
+    state.digest_pending = False
@@ -0,0 +1,132 @@
+import logging
+import math
+import os
+import socket
+import threading
+import uuid
+import zlib
+from typing import Optional
+
+from data.base import DataManager
+from data.user import User
+
+logger = logging.getLogger(__name__)
+
+LEASE_TTL = 90  # seconds
+LEASE_REFRESH_INTERVAL = LEASE_TTL // 3
+
+SHARD_LEASE_PREFIX = "poller-shard:"
+WORKER_LEASE_PREFIX = "poller-worker:"
+
+
+def shard_for(user_id: str, shard_count: int) -> int:
+    """Stable shard index for a user (builtin `hash` is salted per process)"""
+    return zlib.crc32(user_id.encode()) % shard_count
+
+
+def lease_name(shard: int, shard_count: int) -> str:
+    return f"{SHARD_LEASE_PREFIX}{shard}/{shard_count}"
+
+
+class ShardLease:
+    """
+    Holds this worker's share of the `shard_count` poller shards.
+
+    Every worker also keeps a presence lease, so each one knows how many are
+    alive and takes ⌈shard_count / workers⌉ shards: a worker that has more
+    hands the surplus back, and one with fewer claims free or expired shards.
+    So all shards stay polled when workers die or are scaled down (as long as
+    one is left), and extra workers simply stand by.
+
+    `shard_count` (POLLER_SHARDS) must be the same on every worker: lease names
+    include it, so workers with different counts don't see each other's shards
+    and users get polled twice or not at all. A mismatch is logged as an error.
+    """
+
+    def __init__(
+        self,
+        data_manager: DataManager,
+        shard_count: int,
+        owner: Optional[str] = None,
+        ttl: float = LEASE_TTL,
+    ):
+        if shard_count < 1:
+            raise ValueError("shard_count must be at least 1")
+        self.data_manager = data_manager
+        self.shard_count = shard_count
+        self.owner = (
+            owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        )
+        self.ttl = ttl
+        self.shards: frozenset[int] = frozenset()
+        self._lock = threading.Lock()
+
+    @property
+    def worker_lease(self) -> str:
+        return f"{WORKER_LEASE_PREFIX}{self.owner}"
+
+    def _acquire(self, shard: int) -> bool:
+        return self.data_manager.acquire_lease(
+            lease_name(shard, self.shard_count), self.owner, self.ttl
+        )
+
+    def refresh(self) -> frozenset[int]:
+        """Renew the shards we hold, then claim or hand back shards to reach our share"""
+        with self._lock:
+            self.data_manager.acquire_lease(self.worker_lease, self.owner, self.ttl)
+            held = set()
+            for shard in sorted(self.shards):
+                if self._acquire(shard):
+                    held.add(shard)
+                else:
+                    logger.warning("Lost lease on shard %s/%s", shard, self.shard_count)
+
+            workers = max(len(self.data_manager.get_leases(WORKER_LEASE_PREFIX)), 1)
+            share = math.ceil(self.shard_count / workers)
+            handed_back = set()
+            while len(held) > share:
+                shard = max(held)
+                self.data_manager.release_lease(
+                    lease_name(shard, self.shard_count), self.owner
+                )
+                held.discard(shard)
+                handed_back.add(shard)
+                logger.info("Handed back shard %s/%s", shard, self.shard_count)
+            for shard in range(self.shard_count):
+                if len(held) >= share:
+                    break
+                if shard not in held and self._acquire(shard):
+                    logger.info("Acquired shard %s/%s", shard, self.shard_count)
+                    held.add(shard)
+            self.shards = frozenset(held)
+            self._check_coverage(handed_back)
+            return self.shards
+
+    def _check_coverage(self, handed_back: set[int]):
+        leases = self.data_manager.get_leases(SHARD_LEASE_PREFIX)
+        ours = {
+            lease_name(shard, self.shard_count) for shard in range(self.shard_count)
+        }
+        # shards just handed back are picked up by their new owner's next refresh
+        expected_free = {lease_name(shard, self.shard_count) for shard in handed_back}
+        for name in sorted(ours - leases.keys() - expected_free):
+            logger.warning("Nobody holds %s, its users are not being polled", name)
+        for name in sorted(leases.keys() - ours):
+            logger.error(
+                "%s is held by %s: workers disagree on POLLER_SHARDS (ours is %s)",
+                name,
+                leases[name],
+                self.shard_count,
+            )
+
+    def release(self) -> None:
+        with self._lock:
+            for shard in self.shards:
+                self.data_manager.release_lease(
+                    lease_name(shard, self.shard_count), self.owner
+                )
+            self.shards = frozenset()
+            self.data_manager.release_lease(self.worker_lease, self.owner)
+
+    def owns(self, user: User) -> bool:
+        return shard_for(user.user_id, self.shard_count) in self.shards
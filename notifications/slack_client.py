@@ -0,0 +1,17 @@
+import os
+from functools import cache
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from slack_sdk import WebClient
+
+
+@cache
+def get_client() -> "WebClient":
+    """Shared Slack client; slack_sdk is only imported once something is sent"""
+    from slack_sdk import WebClient
+
+    kwargs = {}
+    if base_url := os.environ.get("SLACK_API_URL"):
+        kwargs["base_url"] = base_url
+    return WebClient(token=os.environ.get("SLACK_BOT_TOKEN"), **kwargs)
@@ -0,0 +1,183 @@
+"""
+Optional per-cycle tracing and sampling profiler for the polling jobs.
+
+- TRACE_CYCLES=1 logs one summary line per cycle with the time spent in each
+  stage (load_users, fetch, build, diff, notify, save).
+- PROFILE_CYCLES=1 also samples the cycle's thread and logs its hottest
+  functions. PROFILE_INTERVAL (seconds, default 0.005) and PROFILE_TOP
+  (default 15) tune it.
+
+The environment variables only set the state a process starts in. A running
+worker (see `install_signal_handlers`) toggles tracing on SIGUSR1 and profiling
+on SIGUSR2, e.g. `kill -USR1 <pid>`, so no restart is needed. The switch is
+read at the start of every cycle.
+"""
+
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_current_trace: ContextVar[Optional["CycleTrace"]] = ContextVar(
+    "current_trace", default=None
+)
+_NO_SPAN = nullcontext()
+
+
+# set by signals, taking precedence over the environment
+_overrides: dict[str, bool] = {}
+
+
+def _enabled(name: str) -> bool:
+    if name in _overrides:
+        return _overrides[name]
+    return os.environ.get(name, "").lower() in ("1", "true", "yes")
+
+
+def toggle(name: str) -> bool:
+    """Flip TRACE_CYCLES or PROFILE_CYCLES for this process from now on"""
+    _overrides[name] = enabled = not _enabled(name)
+    logger.info("%s %s", name, "on" if enabled else "off")
+    return enabled
+
+
+def install_signal_handlers() -> None:
+    """
+    SIGUSR1 toggles tracing and SIGUSR2 profiling. Must be called from the main
+    thread; not for gunicorn workers, which use both signals themselves.
+    """
+    signal.signal(signal.SIGUSR1, lambda signum, frame: toggle("TRACE_CYCLES"))
+    signal.signal(signal.SIGUSR2, lambda signum, frame: toggle("PROFILE_CYCLES"))
+
+
+class CycleTrace:
+    def __init__(self, name: str, **fields):
+        self.name = name
+        self.fields = fields
+        self.durations = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[stage] += time.perf_counter() - start
+            self.counts[stage] += 1
+
+    def summary(self) -> str:
+        total = time.perf_counter() - self.start
+        parts = [f"cycle={self.name}"]
+        parts += [f"{k}={v}" for k, v in self.fields.items()]
+        parts.append(f"total={total:.3f}s")
+        parts += [
+            f"{stage}={self.durations[stage]:.3f}s/{self.counts[stage]}"
+            for stage in self.durations
+        ]
+        return " ".join(parts)
+
+
+def span(stage: str):
+    """Time a stage of the current cycle; a no-op when tracing is off"""
+    trace = _current_trace.get()
+    if trace is None:
+        return _NO_SPAN
+    return trace.span(stage)
+
+
+def set_field(key: str, value) -> None:
+    """Attach a value (e.g. the number of users) to the current cycle's summary"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.fields[key] = value
+
+
+class SamplingProfiler:
+    """Samples one thread's stack from a background thread and counts hot functions"""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.self_samples = Counter()
+        self.total_samples = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            self.self_samples[self._describe(frame)] += 1
+            seen = set()
+            while frame is not None:
+                key = self._describe(frame)
+                if key not in seen:
+                    seen.add(key)
+                    self.total_samples[key] += 1
+                frame = frame.f_back
+
+    @staticmethod
+    def _describe(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+    def report(self, top: int = 15) -> str:
+        if not self.samples:
+            return "no samples"
+        lines = [f"{self.samples} samples every {self.interval * 1000:.1f}ms"]
+        lines.append("  self%  total%  function")
+        for key, count in self.self_samples.most_common(top):
+            lines.append(
+                f"  {100 * count / self.samples:5.1f}  {100 * self.total_samples[key] / self.samples:6.1f}  {key}"
+            )
+        return "\n".join(lines)
+
+
+@contextmanager
+def trace_cycle(name: str, **fields):
+    """Trace (and optionally profile) one polling cycle, logging a summary at the end"""
+    if not _enabled("TRACE_CYCLES") and not _enabled("PROFILE_CYCLES"):
+        yield None
+        return
+    trace = CycleTrace(name, **fields)
+    token = _current_trace.set(trace)
+    profiler = None
+    if _enabled("PROFILE_CYCLES"):
+        profiler = SamplingProfiler(
+            threading.get_ident(),
+            float(os.environ.get("PROFILE_INTERVAL", "0.005")),
+        )
+        profiler.start()
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        if profiler is not None:
+            profiler.stop()
+        logger.info(trace.summary())
+        if profiler is not None:
+            logger.info(
+                "Profile for cycle=%s\n%s",
+                name,
+                profiler.report(int(os.environ.get("PROFILE_TOP", "15"))),
+            )
@@ -0,0 +1,43 @@
+import logging
+import os
+
+from apscheduler.schedulers.blocking import BlockingScheduler
+
+from data import get_data_manager
+from notifications.main_task import add_jobs
+from notifications.metrics import mark_process_dead, serve_metrics
+from notifications.sharding import LEASE_REFRESH_INTERVAL, ShardLease
+from notifications.tracing import install_signal_handlers
+
+
+def run():
+    """
+    Standalone poller process. Run POLLER_SHARDS of these (on one or many hosts
+    sharing the database); users are split between them by a hash of user_id.
+    POLLER_SHARDS must be the same for every worker. If fewer workers are alive,
+    the survivors split all the shards between them.
+    Set METRICS_PORT to expose this worker's metrics on `/metrics` (or share the
+    web app's PROMETHEUS_MULTIPROC_DIR, see notifications.metrics), and send it
+    SIGUSR1/SIGUSR2 to toggle cycle tracing/profiling (see notifications.tracing).
+    """
+    logging.basicConfig(level=logging.INFO)
+    install_signal_handlers()
+    if metrics_port := os.environ.get("METRICS_PORT"):
+        serve_metrics(int(metrics_port))
+    data_manager = get_data_manager()
+    lease = ShardLease(data_manager, int(os.environ.get("POLLER_SHARDS", "1")))
+    lease.refresh()
+    scheduler = BlockingScheduler()
+    scheduler.add_job(lease.refresh, "interval", seconds=LEASE_REFRESH_INTERVAL)
+    add_jobs(scheduler, data_manager, owns=lease.owns)
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        lease.release()
+        mark_process_dead()
+
+
+if __name__ == "__main__":
+    run()